@@ -8,152 +8,121 @@
 import os
 import json
 import sys
-import tempfile
+import re
 import random
+import shutil
+import time
+import hashlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from tqdm import tqdm
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # 添加utils目录到Python路径
-sys.path.append('utils')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'utils'))
+from split_lines_store import SplitLinesStore, STORE_SUFFIX
 
-def arrow_to_jsonl(arrow_path: str, jsonl_path: str):
-    """
-    将 .arrow 文件转换为 .jsonl
-    使用现有的arrow2json.py逻辑
-    """
-    try:
-        import pyarrow as pa
-        import pyarrow.ipc as ipc
-        
-        if os.path.exists(jsonl_path):
-            os.remove(jsonl_path)  # 若目标文件已存在先删除，避免追加造成重复
+# 需要从.arrow文件中读取的列
+ARROW_COLUMNS = ('code', 'name', 'asm')
 
-        batches = 0
-        rows = 0
+# 大文件按RecordBatch范围切分任务时，每个任务包含的batch数
+BATCHES_PER_TASK = 64
 
-        with pa.OSFile(arrow_path, 'rb') as source, \
-             ipc.RecordBatchStreamReader(source) as reader, \
-             open(jsonl_path, 'a', encoding='utf-8') as sink:
+# 合并分片文件时的拷贝缓冲区大小
+MERGE_BUFFER_SIZE = 16 * 1024 * 1024
 
-            for batch in reader:
-                # 将本批次 Arrow RecordBatch 转成 pandas.DataFrame
-                df = batch.to_pandas()
+# 输出格式：jsonl 为 {instruction, input, output} 每行一条；parquet/arrow 为列式存储，
+# instruction 字典编码，split_lines/asm/遮挡后的代码/被遮挡的代码块各占一列，input/output 在读取时拼接
+OUTPUT_FORMATS = ('jsonl', 'parquet', 'arrow')
+OUTPUT_EXTS = {'jsonl': '.jsonl', 'parquet': '.parquet', 'arrow': '.arrow'}
 
-                # orient='records' → List[dict]; lines=True → 每条记录结尾带 '\n'
-                json_str = df.to_json(orient='records', lines=True, force_ascii=False)
-                sink.write(json_str)  # 直接写入文件
+# 写出器每攒够多少条记录写出一次（jsonl 为一次 write + flush，列式为一个RecordBatch / row group）
+WRITE_BATCH_SIZE = 4096
 
-                batches += 1
-                rows += len(df)
+# 断点续跑：输出目录下的清单文件（记录配置与每个分片的状态），以及每个任务输出文件旁的检查点后缀
+MANIFEST_NAME = 'manifest.json'
+CHECKPOINT_SUFFIX = '.ckpt'
 
-        print(f'  转换完成: {rows} 条记录（{batches} 个 batch）')
-        return True
-    except Exception as e:
-        print(f'  转换失败: {e}')
-        return False
+# 哈希/校验输出文件时的读取块大小
+HASH_CHUNK_SIZE = 16 * 1024 * 1024
+
+INSTRUCTION = 'Please output the masked code blocks in the given assembly code. The code has been split into blocks based on control flow analysis, and some blocks have been masked with <MASK>. You need to reconstruct the original code by filling in the masked blocks.'
 
-def extract_masked_blocks(code_lines, split_lines, blocks_to_mask):
+def block_ranges(split_lines, num_lines):
     """
-    提取被遮挡的代码块
-    
+    由split_lines计算各block的行范围（只排序一次，不再逐行判断 i in split_lines）
+    第一个分块行之前的代码不属于任何block；超出代码行数的分块行被忽略
+
     Args:
-        code_lines: 代码行列表
-        split_lines: 分块行号列表
-        blocks_to_mask: 被遮挡的block起始行号集合
-    
+        split_lines: 分块行号列表（可无序、可重复）
+        num_lines: 代码行数
+
     Returns:
-        masked_blocks: 被遮挡的代码块列表
+        list: [(block起始行号, 下一个block起始行号)]，行号从1开始
     """
-    if not split_lines or not blocks_to_mask:
-        return []
-    
-    masked_blocks = []
-    current_block_start = None
-    
-    for i, line in enumerate(code_lines, 1):
-        if i in split_lines:
-            # 新block开始
-            if current_block_start is not None:
-                # 处理前一个block
-                if current_block_start in blocks_to_mask:
-                    # 提取被遮挡的block
-                    block_lines = code_lines[current_block_start-1:i-1]
-                    masked_blocks.append('\n'.join(block_lines))
-            current_block_start = i
-    
-    # 处理最后一个block
-    if current_block_start is not None and current_block_start in blocks_to_mask:
-        block_lines = code_lines[current_block_start-1:]
-        masked_blocks.append('\n'.join(block_lines))
-    
-    return masked_blocks
+    starts = sorted({line for line in split_lines if 1 <= line <= num_lines})
+    return list(zip(starts, starts[1:] + [num_lines + 1]))
 
-def mask_code_by_split_lines(code_lines, split_lines, mask_ratio=0.4):
+def mask_code_blocks(code_lines, split_lines, mask_ratio=0.4):
     """
-    根据split_lines随机遮挡约40%的block
-    
+    单次遍历完成遮挡：同时生成遮挡后的代码行与被遮挡的代码块
+
     Args:
         code_lines: 代码行列表
         split_lines: 分块行号列表
         mask_ratio: 遮挡比例，默认0.4
-    
+
     Returns:
         masked_code_lines: 遮挡后的代码行列表
+        masked_blocks: 被遮挡的代码块列表
         blocks_to_mask: 被遮挡的block起始行号集合
     """
     if not split_lines:
-        return code_lines, set()
-    
+        return code_lines, [], set()
+
     # 如果只有一个block，全部遮挡
     if len(split_lines) == 1:
-        return ['<MASK>'] * len(code_lines), set(split_lines)
-    
-    # 计算要遮挡的block数量
-    num_blocks = len(split_lines)
-    num_to_mask = max(1, int(num_blocks * mask_ratio))
-    
+        blocks_to_mask = set(split_lines)
+        masked_blocks = ['\n'.join(code_lines[start-1:]) for start, _ in block_ranges(split_lines, len(code_lines))]
+        return ['<MASK>'] * len(code_lines), masked_blocks, blocks_to_mask
+
     # 随机选择要遮挡的block
+    num_to_mask = max(1, int(len(split_lines) * mask_ratio))
     blocks_to_mask = set(random.sample(split_lines, num_to_mask))
-    
-    # 创建遮挡后的代码行
+
     masked_lines = []
-    current_block_start = None
-    
-    for i, line in enumerate(code_lines, 1):
-        if i in split_lines:
-            # 新block开始
-            if current_block_start is not None:
-                # 处理前一个block
-                if current_block_start in blocks_to_mask:
-                    # 遮挡整个block
-                    masked_lines.extend(['<MASK>'] * (i - current_block_start))
-                else:
-                    # 保持原样
-                    masked_lines.extend(code_lines[current_block_start-1:i-1])
-            current_block_start = i
-    
-    # 处理最后一个block
-    if current_block_start is not None:
-        if current_block_start in blocks_to_mask:
-            masked_lines.extend(['<MASK>'] * (len(code_lines) - current_block_start + 1))
+    masked_blocks = []
+    for start, stop in block_ranges(split_lines, len(code_lines)):
+        block_lines = code_lines[start-1:stop-1]
+        if start in blocks_to_mask:
+            masked_lines.extend(['<MASK>'] * len(block_lines))
+            masked_blocks.append('\n'.join(block_lines))
         else:
-            masked_lines.extend(code_lines[current_block_start-1:])
-    
-    return masked_lines, blocks_to_mask
+            masked_lines.extend(block_lines)
+    return masked_lines, masked_blocks, blocks_to_mask
 
 def load_split_lines_results(results_file):
     """
     加载现有的split_lines结果文件
     
     Args:
-        results_file: 包含split_lines结果的文件路径
+        results_file: 包含split_lines结果的文件路径（JSON数组或JSONL）
     
     Returns:
         dict: 以name为key，split_lines为value的字典
     """
     try:
         with open(results_file, 'r', encoding='utf-8') as f:
-            results = json.load(f)
+            if results_file.endswith('.jsonl'):
+                # utils/main.py 多进程模式输出的JSONL，每行一条结果
+                results = [json.loads(line) for line in f if line.strip()]
+            else:
+                results = json.load(f)
         
         # 构建name到split_lines的映射
         split_lines_map = {}
@@ -169,171 +138,810 @@ def load_split_lines_results(results_file):
         print(f"  加载split_lines结果失败: {e}")
         return {}
 
-def main():
-    """主函数"""
-    # 设置路径
-    datasets_dir = "datasets"
-    all_blocks_dir = "/home/featurize/data/all_blocks_jsons"  # 包含split_lines结果的目录
-    output_dir = "/home/featurize/data/instructs"  # 输出目录
-    
-    # 确保输出目录存在
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # 查找所有.arrow文件
+def find_arrow_files(datasets_dir):
+    """查找目录下所有.arrow文件（按路径排序，保证任务划分与合并顺序确定）"""
     arrow_files = []
     for root, dirs, files in os.walk(datasets_dir):
         for file in files:
             if file.endswith('.arrow'):
                 arrow_files.append(os.path.join(root, file))
-    
+    return sorted(arrow_files)
+
+def get_arrow_batch_sizes(arrow_path):
+    """
+    获取.arrow文件中每个RecordBatch的行数
+    文件通过memory_map打开，只读取batch元数据，不拷贝数据
+
+    Returns:
+        list: 每个batch的行数
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    with pa.memory_map(arrow_path, 'r') as source, \
+         ipc.RecordBatchStreamReader(source) as reader:
+        return [batch.num_rows for batch in reader]
+
+def plan_shard_tasks(arrow_file, split_lines_file, output_dir, batches_per_task=BATCHES_PER_TASK,
+                     output_format='jsonl', write_batch_size=WRITE_BATCH_SIZE):
+    """
+    将单个.arrow文件划分为若干个按RecordBatch范围切分的任务
+    小文件只有一个任务；大文件每 batches_per_task 个batch一个任务
+
+    Returns:
+        list: 任务字典列表，每个任务写出一个独立的分片文件
+    """
+    arrow_name = Path(arrow_file).stem
+    batch_sizes = get_arrow_batch_sizes(arrow_file)
+    batches_per_task = max(1, batches_per_task)
+
+    tasks = []
+    record_offset = 0
+    for part_idx, start_batch in enumerate(range(0, max(len(batch_sizes), 1), batches_per_task)):
+        stop_batch = min(start_batch + batches_per_task, len(batch_sizes))
+        tasks.append({
+            'arrow_file': arrow_file,
+            'split_lines_file': split_lines_file,
+            'output_file': part_file_path(output_dir, arrow_name, part_idx, output_format),
+            'output_format': output_format,
+            'write_batch_size': write_batch_size,
+            'part_idx': part_idx,
+            'start_batch': start_batch,
+            'stop_batch': stop_batch,
+            'batches_per_task': batches_per_task,
+            'record_offset': record_offset,
+        })
+        record_offset += sum(batch_sizes[start_batch:stop_batch])
+    return tasks
+
+def part_file_path(output_dir, arrow_name, part_idx, output_format='jsonl'):
+    """分片输出文件路径"""
+    return os.path.join(output_dir, f"{arrow_name}_example.part{part_idx:05d}{OUTPUT_EXTS[output_format]}")
+
+# 分片文件及其检查点的文件名，见 part_file_path / checkpoint_path
+PART_FILE_PATTERN = re.compile(r'_example\.part\d{5}\.(jsonl|parquet|arrow)(\.ckpt)?$')
+
+def remove_part_files(output_dir):
+    """删除输出目录中所有分片文件与检查点"""
+    removed = 0
+    for file in os.listdir(output_dir):
+        if PART_FILE_PATTERN.search(file):
+            os.remove(os.path.join(output_dir, file))
+            removed += 1
+    return removed
+
+def find_split_lines_file(all_blocks_dir, arrow_name):
+    """
+    查找.arrow文件对应的split_lines结果：优先使用 split_lines_store 生成的索引存储，
+    其次是 JSON 数组，最后是 utils/main.py 多进程模式输出的 JSONL
+
+    Returns:
+        str: 结果文件路径，不存在时返回None
+    """
+    base = os.path.join(all_blocks_dir, f"{arrow_name}_all_blocks")
+    for ext in (STORE_SUFFIX, '.json', '.jsonl'):
+        if os.path.exists(base + ext):
+            return base + ext
+    return None
+
+def open_split_lines(split_lines_file):
+    """打开split_lines结果：索引存储按需查找（memory_map），JSON/JSONL整体加载为字典"""
+    if split_lines_file.endswith(STORE_SUFFIX):
+        try:
+            store = SplitLinesStore(split_lines_file)
+        except Exception as e:
+            print(f"  打开split_lines存储失败: {e}")
+            return {}
+        print(f"  打开了 {len(store)} 条split_lines结果（索引存储）")
+        return store
+    return load_split_lines_results(split_lines_file)
+
+# 每个worker进程缓存最近一次加载的split_lines结果，同一文件的多个分片任务不重复加载
+_split_lines_cache = {}
+
+def _load_split_lines_cached(split_lines_file):
+    if split_lines_file not in _split_lines_cache:
+        _split_lines_cache.clear()
+        _split_lines_cache[split_lines_file] = open_split_lines(split_lines_file)
+    return _split_lines_cache[split_lines_file]
+
+def write_json_atomic(path, data):
+    """先写临时文件再替换，进程在写入中途被杀也不会留下半个文件"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def read_json_file(path):
+    """读取JSON文件，不存在或已损坏时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def hash_file(path, length=None):
+    """
+    计算文件前 length 字节（None表示整个文件）的sha256
+
+    Returns:
+        hashlib对象，可继续update
+    """
+    digest = hashlib.sha256()
+    remaining = length
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(HASH_CHUNK_SIZE if remaining is None else min(HASH_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest
+
+def checkpoint_path(output_file):
+    return output_file + CHECKPOINT_SUFFIX
+
+def checkpoint_identity(task, seed=None):
+    """
+    检查点中标识任务的字段：batch范围、种子、切分方式与输出格式都相同时检查点才可复用
+    （例如换了 --batches-per-task 后同名分片覆盖的batch范围不同，旧检查点不能续写）
+    """
+    return {
+        'start_batch': task['start_batch'],
+        'stop_batch': task['stop_batch'],
+        'seed': seed,
+        'batches_per_task': task.get('batches_per_task'),
+        'output_format': task.get('output_format', 'jsonl'),
+    }
+
+def is_output_intact(output_file, state):
+    """输出文件的大小与内容哈希是否与清单/检查点中的记录一致"""
+    return (state is not None and os.path.exists(output_file)
+            and os.path.getsize(output_file) == state.get('bytes')
+            and hash_file(output_file).hexdigest() == state.get('sha256'))
+
+def load_resume_state(task, seed=None):
+    """
+    读取任务的检查点，判断可以如何续跑；检查点的任务标识（checkpoint_identity）必须与本次任务完全一致
+
+    Returns:
+        tuple: ('done', 检查点) 分片已完成；('partial', 检查点) 可从检查点续写（仅jsonl）；(None, None) 需要从头处理
+    """
+    output_file = task['output_file']
+    state = read_json_file(checkpoint_path(output_file))
+    identity = checkpoint_identity(task, seed)
+    if state is None or any(state.get(key) != value for key, value in identity.items()):
+        return None, None
+    if state.get('done'):
+        return ('done', state) if is_output_intact(output_file, state) else (None, None)
+    if task.get('output_format', 'jsonl') != 'jsonl' or not os.path.exists(output_file) \
+            or os.path.getsize(output_file) < state['bytes']:
+        return None, None
+    digest = hash_file(output_file, state['bytes'])
+    if digest.hexdigest() != state['sha256']:
+        return None, None
+    state['digest'] = digest
+    return 'partial', state
+
+def run_shard_task(task, seed=None):
+    """
+    执行单个分片任务（在worker进程中运行）
+
+    Args:
+        task: plan_shard_tasks生成的任务字典
+        seed: 随机种子；为None时每个任务从系统熵重新播种，避免fork出的进程共享随机状态
+
+    Returns:
+        tuple: (arrow_file, part_idx, 处理的记录数, 状态)，状态为 'done' 或 'failed'（分片文件没有完整写出）
+    """
+    arrow_name = Path(task['arrow_file']).stem
+    resume_state = None
+    if task.get('resume'):
+        status, resume_state = load_resume_state(task, seed)
+        if status == 'done':
+            return task['arrow_file'], task['part_idx'], resume_state['processed'], 'done'
+
+    if seed is None:
+        random.seed()
+    else:
+        random.seed(f"{seed}:{arrow_name}:{task['start_batch']}")
+
+    split_lines_map = _load_split_lines_cached(task['split_lines_file'])
+    if not split_lines_map:
+        print(f"  跳过 {task['arrow_file']}: split_lines结果为空")
+        return task['arrow_file'], task['part_idx'], 0, 'failed'
+
+    try:
+        count = write_instruction_records(
+            task['arrow_file'], task['output_file'], split_lines_map,
+            start_batch=task['start_batch'], stop_batch=task['stop_batch'],
+            record_offset=task['record_offset'], show_progress=False,
+            output_format=task.get('output_format', 'jsonl'),
+            write_batch_size=task.get('write_batch_size', WRITE_BATCH_SIZE),
+            checkpoint=checkpoint_identity(task, seed), resume_state=resume_state
+        )
+    except Exception as e:
+        print(f"  错误: 处理文件 {task['arrow_file']} 的第{task['part_idx']}个分片时出错: {e}")
+        import traceback
+        traceback.print_exc()
+        for path in (task['output_file'], checkpoint_path(task['output_file'])):
+            if os.path.exists(path):
+                os.remove(path)
+        return task['arrow_file'], task['part_idx'], 0, 'failed'
+    return task['arrow_file'], task['part_idx'], count, 'done'
+
+def merge_part_files(output_dir, arrow_name, num_parts, output_format='jsonl'):
+    """
+    按分片序号顺序合并分片文件为 {arrow_name}_example.{jsonl,parquet,arrow}，并删除分片
+    jsonl 直接按字节拼接；列式格式逐个RecordBatch / row group 重新写出
+
+    Returns:
+        str: 合并后的文件路径；缺少任何一个分片时不合并，返回None（已有分片保留，续跑时复用）
+    """
+    part_files = [part_file_path(output_dir, arrow_name, i, output_format) for i in range(num_parts)]
+    missing = [p for p in part_files if not os.path.exists(p)]
+    if missing:
+        print(f"  {arrow_name}: 缺少 {len(missing)}/{num_parts} 个分片，不合并")
+        return None
+
+    output_file = os.path.join(output_dir, f"{arrow_name}_example{OUTPUT_EXTS[output_format]}")
+    if output_format == 'jsonl':
+        with open(output_file, 'wb') as fout:
+            for part_file in part_files:
+                with open(part_file, 'rb') as fin:
+                    shutil.copyfileobj(fin, fout, MERGE_BUFFER_SIZE)
+    else:
+        merge_columnar_files(part_files, output_file, output_format)
+    for part_file in part_files:
+        os.remove(part_file)
+    return output_file
+
+def merge_columnar_files(part_files, output_file, output_format):
+    """按顺序合并列式分片文件，内存中同时只有一个RecordBatch / row group"""
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    schema = instruction_schema()
+    if output_format == 'parquet':
+        with pq.ParquetWriter(output_file, schema, compression='zstd') as writer:
+            for part_file in part_files:
+                part = pq.ParquetFile(part_file, memory_map=True)
+                for i in range(part.num_row_groups):
+                    writer.write_table(part.read_row_group(i))
+    else:
+        with ipc.new_file(output_file, schema) as writer:
+            for part_file in part_files:
+                with pa.memory_map(part_file, 'r') as source:
+                    reader = ipc.open_file(source)
+                    for i in range(reader.num_record_batches):
+                        writer.write_batch(reader.get_batch(i))
+
+def load_manifest(manifest_path, config):
+    """
+    读取清单文件；不存在、已损坏或配置与本次运行不同时返回新的空清单
+    配置不同时同时删除输出目录中旧的分片文件与检查点，避免按旧配置写出的分片被续写或合并
+    """
+    manifest = read_json_file(manifest_path)
+    if manifest is not None and manifest.get('config') != config:
+        removed = remove_part_files(os.path.dirname(os.path.abspath(manifest_path)))
+        print(f"清单 {manifest_path} 的配置与本次运行不同，忽略已有进度（删除了 {removed} 个旧分片文件与检查点）")
+        manifest = None
+    return manifest or {'config': config, 'shards': {}}
+
+def finish_shard(manifest, manifest_path, output_dir, arrow_file, tasks, records, output_format, failed_parts=()):
+    """
+    分片的所有任务结束后合并输出、删除检查点，并在清单中记为完成
+    有任务失败或缺少分片文件时不合并，在清单中记为失败；成功任务的分片与检查点保留，--resume 时只重做失败的任务
+    """
+    arrow_name = Path(arrow_file).stem
+    output_file = None
+    if failed_parts:
+        print(f"  {arrow_name}: 第 {', '.join(map(str, sorted(failed_parts)))} 个分片处理失败，不合并")
+    else:
+        output_file = merge_part_files(output_dir, arrow_name, len(tasks), output_format)
+    if output_file is None:
+        manifest['shards'][arrow_name] = {'status': 'failed', 'arrow_file': arrow_file,
+                                          'failed_parts': sorted(failed_parts)}
+    else:
+        for task in tasks:
+            if os.path.exists(checkpoint_path(task['output_file'])):
+                os.remove(checkpoint_path(task['output_file']))
+        manifest['shards'][arrow_name] = {
+            'status': 'done',
+            'arrow_file': arrow_file,
+            'output_file': output_file,
+            'records': records,
+            'bytes': os.path.getsize(output_file),
+            'sha256': hash_file(output_file).hexdigest(),
+        }
+    write_json_atomic(manifest_path, manifest)
+    return output_file
+
+def main(datasets_dir="datasets",
+         all_blocks_dir="/home/featurize/data/all_blocks_jsons",  # 包含split_lines结果的目录
+         output_dir="/home/featurize/data/instructs",  # 输出目录
+         workers=None,
+         batches_per_task=BATCHES_PER_TASK,
+         seed=None,
+         output_format='jsonl',
+         write_batch_size=WRITE_BATCH_SIZE,
+         resume=False):
+    """
+    主函数
+    所有.arrow文件按RecordBatch范围切分为任务，分发到进程池并行处理，
+    每个任务写独立的分片文件，一个文件的全部任务完成后按分片顺序确定性地合并
+
+    进度记录在输出目录的 manifest.json（每个文件的状态、记录数、输出字节数与sha256）
+    和每个任务输出旁的 .ckpt 检查点（已提交的batch、记录数、字节偏移、内容哈希与随机数状态）中，
+    resume=True 时跳过已完成的文件与任务，未完成的jsonl任务从最后提交的batch继续；
+    有任务失败的文件不合并、在清单中记为失败，续跑时重新处理失败的任务
+
+    Args:
+        workers: 进程数，默认为CPU核数；为1时在当前进程中顺序执行
+        batches_per_task: 大文件按多少个RecordBatch切分为一个任务
+        seed: 随机遮挡的种子，指定后结果与进程数无关、可复现
+        output_format: 输出格式，见 OUTPUT_FORMATS
+        write_batch_size: 每批写出的记录数（同时是输出文件的flush与检查点间隔）
+        resume: 是否根据清单与检查点续跑
+    """
+    workers = workers or os.cpu_count() or 1
+    start_time = time.time()
+
+    # 确保输出目录存在
+    os.makedirs(output_dir, exist_ok=True)
+
+    # 查找所有.arrow文件
+    arrow_files = find_arrow_files(datasets_dir)
+
     if not arrow_files:
         print("未找到任何.arrow文件")
         return
-    
+
     print(f"找到 {len(arrow_files)} 个.arrow文件:")
     for arrow_file in arrow_files:
         print(f"  {arrow_file}")
-    
-    print("\n开始处理...")
-    
-    # 总体进度条
-    total_processed = 0
-    total_records = 0
-    
-    # 处理每个.arrow文件
-    for file_idx, arrow_file in enumerate(tqdm(arrow_files, desc="处理文件", unit="file")):
+
+    # 影响输出内容的配置不同时，已有进度不可复用
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    config = {'seed': seed, 'batches_per_task': batches_per_task, 'output_format': output_format}
+    manifest = load_manifest(manifest_path, config) if resume else {'config': config, 'shards': {}}
+
+    # 划分任务
+    tasks = []
+    shard_tasks = {}
+    finished = {}
+    for arrow_file in arrow_files:
         # 生成对应的split_lines结果文件路径
         arrow_name = Path(arrow_file).stem  # 去掉.arrow后缀
-        split_lines_file = os.path.join(all_blocks_dir, f"{arrow_name}_all_blocks.json")
-        
-        if not os.path.exists(split_lines_file):
-            print(f"\n跳过 {arrow_file}: 未找到对应的split_lines文件 {split_lines_file}")
+
+        shard = manifest['shards'].get(arrow_name)
+        if resume and shard is not None and shard['status'] == 'done' and is_output_intact(shard['output_file'], shard):
+            print(f"跳过 {arrow_file}: 清单中已完成")
+            finished[arrow_file] = (shard['output_file'], shard['records'], False)
             continue
-        
-        print(f"\n[{file_idx+1}/{len(arrow_files)}] 处理文件: {arrow_name}")
-        print(f"  加载split_lines结果文件: {split_lines_file}")
-        split_lines_map = load_split_lines_results(split_lines_file)
-        
-        if not split_lines_map:
-            print(f"  跳过 {arrow_file}: split_lines结果为空")
+
+        split_lines_file = find_split_lines_file(all_blocks_dir, arrow_name)
+
+        if split_lines_file is None:
+            print(f"跳过 {arrow_file}: 未找到对应的split_lines文件 {arrow_name}_all_blocks.json")
             continue
-        
-        # 处理单个文件
-        file_records = process_arrow_file(arrow_file, output_dir, split_lines_map)
-        total_records += file_records
+
+        shard_tasks[arrow_file] = plan_shard_tasks(arrow_file, split_lines_file, output_dir, batches_per_task,
+                                                   output_format, write_batch_size)
+        for task in shard_tasks[arrow_file]:
+            task['resume'] = resume
+        tasks.extend(shard_tasks[arrow_file])
+        manifest['shards'][arrow_name] = {'status': 'running', 'arrow_file': arrow_file,
+                                          'parts': len(shard_tasks[arrow_file])}
+    write_json_atomic(manifest_path, manifest)
+
+    print(f"\n开始处理: {len(shard_tasks)} 个文件, {len(tasks)} 个任务, {workers} 个进程...")
+
+    shard_records = {arrow_file: 0 for arrow_file in shard_tasks}
+    remaining_parts = {arrow_file: len(parts) for arrow_file, parts in shard_tasks.items()}
+    failed_parts = {arrow_file: [] for arrow_file in shard_tasks}
+
+    def task_done(arrow_file, part_idx, count, status):
+        # 一个文件的全部任务结束后立即合并并写入清单，之后中断也不需要重做
+        shard_records[arrow_file] += count
+        remaining_parts[arrow_file] -= 1
+        if status != 'done':
+            failed_parts[arrow_file].append(part_idx)
+        if remaining_parts[arrow_file] == 0:
+            output_file = finish_shard(manifest, manifest_path, output_dir, arrow_file, shard_tasks[arrow_file],
+                                       shard_records[arrow_file], output_format, failed_parts[arrow_file])
+            if output_file is not None:
+                finished[arrow_file] = (output_file, shard_records[arrow_file], True)
+
+    if workers == 1:
+        for task in tqdm(tasks, desc="处理任务", unit="task"):
+            task_done(*run_shard_task(task, seed))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_shard_task, task, seed) for task in tasks]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="处理任务", unit="task"):
+                task_done(*future.result())
+
+    # 按文件顺序汇总（吞吐量只统计本次运行处理的文件）
+    total_processed = 0
+    total_records = 0
+    run_records = 0
+    run_bytes = 0
+    for arrow_file in arrow_files:
+        if arrow_file not in finished:
+            continue
+        output_file, records, processed_this_run = finished[arrow_file]
         total_processed += 1
-        
-        # 显示实时统计
-        print(f"  文件处理完成，记录数: {file_records}")
-        print(f"  累计处理: {total_processed}/{len(arrow_files)} 文件, {total_records} 条记录")
-    
+        total_records += records
+        if processed_this_run:
+            run_records += records
+            run_bytes += os.path.getsize(output_file)
+        print(f"  {Path(arrow_file).stem}: {records} 条记录 -> {output_file}")
+
     print(f"\n所有文件处理完成！")
     print(f"总计处理: {total_processed}/{len(arrow_files)} 文件")
+    failed = [Path(arrow_file).stem for arrow_file in shard_tasks
+              if manifest['shards'][Path(arrow_file).stem]['status'] != 'done']
+    if failed:
+        print(f"处理失败: {', '.join(failed)}（使用 --resume 重新处理失败的分片）")
     print(f"总计生成: {total_records} 条训练记录")
+    print(f"吞吐量: {format_throughput(run_records, run_bytes, time.time() - start_time)}")
     print(f"输出目录: {output_dir}")
 
-def process_arrow_file(arrow_file_path, output_dir, split_lines_map):
+def format_throughput(records, num_bytes, elapsed):
+    """格式化吞吐量：条/秒 与 MB/秒"""
+    elapsed = max(elapsed, 1e-9)
+    return f"{records / elapsed:.1f} 条/秒, {num_bytes / elapsed / 1024 / 1024:.2f} MB/秒（耗时 {elapsed:.1f} 秒）"
+
+def iter_arrow_batches(arrow_path, columns=ARROW_COLUMNS, start_batch=0, stop_batch=None):
+    """
+    流式读取 .arrow 文件（IPC stream 格式），逐个 RecordBatch 产出所需列
+    不经过 pandas / 临时jsonl，内存占用只与单个 batch 大小相关
+
+    Args:
+        arrow_path: .arrow文件路径
+        columns: 需要读取的列名
+        start_batch: 起始batch序号（包含）
+        stop_batch: 结束batch序号（不包含），None表示读到文件末尾
+
+    Yields:
+        dict: 列名 -> 本批次该列的值列表（缺失的列为全 None）
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    with pa.memory_map(arrow_path, 'r') as source, \
+         ipc.RecordBatchStreamReader(source) as reader:
+        for batch_idx, batch in enumerate(reader):
+            if batch_idx < start_batch:
+                continue
+            if stop_batch is not None and batch_idx >= stop_batch:
+                break
+            column_values = {}
+            for column in columns:
+                index = batch.schema.get_field_index(column)
+                if index == -1:
+                    column_values[column] = [None] * batch.num_rows
+                else:
+                    column_values[column] = batch.column(index).to_pylist()
+            yield column_values
+
+def format_instruction_record(split_lines, asm, masked_code, masked_blocks, instruction=INSTRUCTION):
+    """
+    构建一条instruction记录，jsonl写出与列式输出的还原都经过这里
+
+    Args:
+        split_lines: 分块行号列表
+        asm: 汇编代码字符串
+        masked_code: 遮挡后的代码
+        masked_blocks: 被遮挡的代码块列表
+
+    Returns:
+        dict: {instruction, input, output}
+    """
+    return {
+        'instruction': instruction,
+        'input': format_instruction_input(split_lines, asm, masked_code),  # 包含split_lines、汇编语言和遮挡后的代码
+        'output': format_instruction_output(masked_blocks)  # 被遮挡的代码块作为输出
+    }
+
+def format_instruction_input(split_lines, asm, masked_code):
+    """构建input内容，包含split_lines、汇编语言和遮挡后的代码"""
+    return f"Split lines: {split_lines}\n\nAssembly language: {asm}\n\nMasked code:\n{masked_code}"
+
+def format_instruction_output(masked_blocks):
+    """被遮挡的代码块拼接为output"""
+    return '\n\n'.join(masked_blocks)
+
+def instruction_schema():
+    """列式输出的schema"""
+    import pyarrow as pa
+
+    return pa.schema([
+        ('instruction', pa.dictionary(pa.int32(), pa.string())),
+        ('split_lines', pa.list_(pa.int32())),
+        ('asm', pa.string()),
+        ('masked_code', pa.string()),
+        ('masked_blocks', pa.list_(pa.string())),
+    ])
+
+def encode_json_line(record):
+    """
+    将一条记录编码为以换行结尾的UTF-8 JSON；安装了 orjson 时使用 orjson
+    标准库按与 orjson 相同的紧凑格式输出，两种方式写出的字节（以及清单/检查点中的sha256）一致
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            # orjson 不接受的内容（如孤立的代理字符）交给标准库处理
+            pass
+    try:
+        return (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+    except UnicodeEncodeError:
+        # 孤立的代理字符无法编码为UTF-8，转义为 \uXXXX
+        return (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+
+class JsonlInstructionWriter:
+    """
+    按 {instruction, input, output} 每行一条写出instruction记录
+    编码后的行先缓存在内存中，每 batch_size 条写入文件并 flush 一次（检查点），不再逐行 flush
+    resume_state 为 load_resume_state 得到的检查点时，截断到检查点记录的字节数后续写
+    """
+
+    def __init__(self, output_file, batch_size=WRITE_BATCH_SIZE, resume_state=None):
+        self.batch_size = max(1, batch_size)
+        self.buffer = []
+        if resume_state is None:
+            self.f = open(output_file, 'wb')
+            self.bytes_written = 0
+            self.digest = hashlib.sha256()
+        else:
+            self.f = open(output_file, 'r+b')
+            self.f.truncate(resume_state['bytes'])
+            self.f.seek(resume_state['bytes'])
+            self.bytes_written = resume_state['bytes']
+            self.digest = resume_state['digest']
+
+    def write(self, split_lines, asm, masked_code, masked_blocks):
+        self.buffer.append(encode_json_line(format_instruction_record(split_lines, asm, masked_code, masked_blocks)))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        data = b''.join(self.buffer)
+        self.f.write(data)
+        self.f.flush()
+        self.bytes_written += len(data)
+        self.digest.update(data)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+class ColumnarInstructionWriter:
+    """
+    以 Parquet 或 Arrow IPC 文件格式写出instruction记录
+    记录先按列攒在内存中，每 batch_size 条写出一个RecordBatch；
+    instruction 列为只含一个取值的字典编码列
+    """
+
+    def __init__(self, output_file, output_format, batch_size=WRITE_BATCH_SIZE):
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = instruction_schema()
+        if output_format == 'parquet':
+            self.writer = pq.ParquetWriter(output_file, self.schema, compression='zstd')
+        else:
+            self.writer = ipc.new_file(output_file, self.schema)
+        self.instruction_dictionary = pa.array([INSTRUCTION], pa.string())
+        self.batch_size = max(1, batch_size)
+        self._reset()
+
+    def _reset(self):
+        self.columns = {'split_lines': [], 'asm': [], 'masked_code': [], 'masked_blocks': []}
+
+    def write(self, split_lines, asm, masked_code, masked_blocks):
+        self.columns['split_lines'].append(split_lines)
+        self.columns['asm'].append(asm)
+        self.columns['masked_code'].append(masked_code)
+        self.columns['masked_blocks'].append(masked_blocks)
+        if len(self.columns['asm']) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        pa = self.pa
+        num_rows = len(self.columns['asm'])
+        if not num_rows:
+            return
+        instruction = pa.DictionaryArray.from_arrays(
+            pa.array([0] * num_rows, pa.int32()), self.instruction_dictionary)
+        arrays = [instruction] + [
+            pa.array(self.columns[field.name], field.type) for field in list(self.schema)[1:]
+        ]
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self._reset()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+def open_instruction_writer(output_file, output_format='jsonl', batch_size=WRITE_BATCH_SIZE, resume_state=None):
+    """按输出格式创建instruction记录的写出器（只有jsonl支持从检查点续写）"""
+    if output_format == 'jsonl':
+        return JsonlInstructionWriter(output_file, batch_size, resume_state)
+    return ColumnarInstructionWriter(output_file, output_format, batch_size)
+
+def read_instruction_table(path, columns=None):
+    """
+    读取列式输出的instruction数据（Parquet 或 Arrow IPC 文件，均以memory_map方式打开）
+
+    Args:
+        path: .parquet 或 .arrow 文件
+        columns: 需要的列，None表示全部
+
+    Returns:
+        pyarrow.Table
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+
+    if path.endswith('.parquet'):
+        return pq.read_table(path, columns=columns, memory_map=True)
+    table = ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return table.select(columns) if columns is not None else table
+
+def iter_instruction_records(path, batch_size=WRITE_BATCH_SIZE):
+    """
+    从列式输出中逐条还原 {instruction, input, output}，与jsonl输出的记录一致
+
+    Yields:
+        dict: {instruction, input, output}
+    """
+    table = read_instruction_table(path)
+    for batch in table.to_batches(max_chunksize=batch_size):
+        columns = batch.to_pydict()
+        for instruction, split_lines, asm, masked_code, masked_blocks in zip(
+                columns['instruction'], columns['split_lines'], columns['asm'],
+                columns['masked_code'], columns['masked_blocks']):
+            yield format_instruction_record(split_lines, asm, masked_code, masked_blocks, instruction)
+
+def write_instruction_records(arrow_file_path, output_file, split_lines_map,
+                              start_batch=0, stop_batch=None, record_offset=0, show_progress=True,
+                              output_format='jsonl', write_batch_size=WRITE_BATCH_SIZE,
+                              checkpoint=None, resume_state=None):
+    """
+    读取.arrow文件中 [start_batch, stop_batch) 范围内的记录，生成instruction记录写入output_file
+
+    Args:
+        arrow_file_path: .arrow文件路径
+        output_file: 输出文件路径
+        split_lines_map: split_lines结果映射（字典或 SplitLinesStore）
+        start_batch: 起始batch序号（包含）
+        stop_batch: 结束batch序号（不包含），None表示读到文件末尾
+        record_offset: 起始batch之前的记录数，用于生成全局记录序号
+        show_progress: 是否显示记录级进度条
+        output_format: 输出格式，见 OUTPUT_FORMATS
+        write_batch_size: 写出器每批写出的记录数
+        checkpoint: checkpoint_identity 得到的任务标识，不为None时在 output_file 旁写检查点
+            （jsonl 每写出约 write_batch_size 条记录后在batch边界提交一次）
+        resume_state: load_resume_state 得到的未完成检查点，从其记录的batch、字节数与随机数状态继续
+
+    Returns:
+        int: 处理的记录数
+    """
+    processed_count = 0
+    total_count = 0
+    if resume_state is not None:
+        start_batch = resume_state['next_batch']
+        processed_count = resume_state['processed']
+        total_count = resume_state['total_count']
+        version, internal_state, gauss_next = resume_state['random_state']
+        random.setstate((version, tuple(internal_state), gauss_next))
+
+    def commit(num_bytes, sha256, done=False):
+        # 检查点只在batch边界提交，续跑时从下一个batch开始，不会重复或遗漏记录
+        write_json_atomic(checkpoint_path(output_file), {
+            **checkpoint,
+            'next_batch': next_batch,
+            'total_count': total_count,
+            'processed': processed_count,
+            'bytes': num_bytes,
+            'sha256': sha256,
+            'random_state': random.getstate(),
+            'done': done,
+        })
+
+    writer = open_instruction_writer(output_file, output_format, write_batch_size, resume_state)
+    checkpoint_jsonl = checkpoint is not None and output_format == 'jsonl'
+    uncommitted = 0
+    next_batch = start_batch
+    try:
+        with tqdm(desc=f"  处理记录", unit="record", leave=False, disable=not show_progress) as pbar:
+            for batch_idx, columns in enumerate(
+                    iter_arrow_batches(arrow_file_path, start_batch=start_batch, stop_batch=stop_batch),
+                    start_batch):
+                for code, name, asm in zip(columns['code'], columns['name'], columns['asm']):
+                    idx = record_offset + total_count
+                    total_count += 1
+                    if name is None:
+                        name = f'code_{idx}'
+
+                    if not code:
+                        print(f"    警告: 第{idx+1}条记录缺少code字段")
+                        continue
+
+                    uncommitted += 1
+                    try:
+                        # 从split_lines_map中获取split_lines；每条记录只遮挡一次，出错也不重试，
+                        # 指定种子时随机数按记录顺序消耗，结果可复现
+                        split_lines = split_lines_map.get(name, [])
+                        masked_code_lines, masked_blocks, _ = mask_code_blocks(code.split('\n'), split_lines)
+                        writer.write(split_lines, asm if asm is not None else '', '\n'.join(masked_code_lines),
+                                     masked_blocks)
+
+                        processed_count += 1
+
+                    except Exception as e:
+                        print(f"    错误: 处理第{idx+1}条记录时出错: {e}")
+                        continue
+                pbar.update(len(columns['code']))
+
+                next_batch = batch_idx + 1
+                if checkpoint_jsonl and uncommitted >= write_batch_size:
+                    writer.flush()
+                    commit(writer.bytes_written, writer.digest.hexdigest())
+                    uncommitted = 0
+    finally:
+        writer.close()
+
+    if checkpoint_jsonl:
+        commit(writer.bytes_written, writer.digest.hexdigest(), done=True)
+    elif checkpoint is not None:
+        # 列式文件只有写完才可读，完成后记录整个文件的大小与哈希
+        commit(os.path.getsize(output_file), hash_file(output_file).hexdigest(), done=True)
+
+    return processed_count
+
+def process_arrow_file(arrow_file_path, output_dir, split_lines_map, output_format='jsonl'):
     """
     处理单个.arrow文件
-    
+    按 RecordBatch 流式读取 code/name/asm 列，逐批生成并写出instruction记录
+
     Args:
         arrow_file_path: .arrow文件路径
         output_dir: 输出目录
-        split_lines_map: split_lines结果映射
-    
+        split_lines_map: split_lines结果映射（字典或 SplitLinesStore）
+        output_format: 输出格式，见 OUTPUT_FORMATS
+
     Returns:
         int: 处理的记录数
     """
     # 生成输出文件名
     arrow_name = Path(arrow_file_path).stem  # 去掉.arrow后缀
-    output_file = os.path.join(output_dir, f"{arrow_name}_example.jsonl")
-    
+    output_file = os.path.join(output_dir, f"{arrow_name}_example{OUTPUT_EXTS[output_format]}")
+
     try:
-        # 创建临时jsonl文件
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.jsonl', delete=False, encoding='utf-8') as tmp_file:
-            temp_jsonl_path = tmp_file.name
-        
-        # 将.arrow文件转换为.jsonl
-        if not arrow_to_jsonl(arrow_file_path, temp_jsonl_path):
-            return 0
-        
-        # 读取.jsonl文件
-        results = []
-        with open(temp_jsonl_path, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    item = json.loads(line)
-                    results.append(item)
-                except json.JSONDecodeError as e:
-                    print(f"    警告: 第{line_num}行JSON解析错误: {e}")
-                    continue
-        
-        print(f"  读取到 {len(results)} 条记录")
-        
-        # 流式写入example.jsonl文件
-        processed_count = 0
-        with open(output_file, 'w', encoding='utf-8') as f:
-            for idx, item in enumerate(tqdm(results, desc=f"  处理记录", unit="record", leave=False)):
-                try:
-                    code = item.get('code', '')
-                    name = item.get('name', f'code_{idx}')
-                    file_path = item.get('file', '')
-                    
-                    if not code:
-                        print(f"    警告: 第{idx+1}条记录缺少code字段")
-                        continue
-                    
-                    # 从split_lines_map中获取split_lines
-                    split_lines = split_lines_map.get(name, [])
-                    
-                    # 将代码按行分割
-                    code_lines = code.split('\n')
-                    
-                    # 根据split_lines遮挡代码
-                    masked_code_lines, blocks_to_mask = mask_code_by_split_lines(code_lines, split_lines)
-                    masked_code = '\n'.join(masked_code_lines)
-                    
-                    # 提取被遮挡的代码块
-                    masked_blocks = extract_masked_blocks(code_lines, split_lines, blocks_to_mask)
-                    
-                    # 获取汇编语言信息
-                    asm = item.get('asm', '')
-                    
-                    # 构建input内容，包含split_lines、汇编语言和遮挡后的代码
-                    input_content = f"Split lines: {split_lines}\n\nAssembly language: {asm}\n\nMasked code:\n{masked_code}"
-                    
-                    # 构建输出记录
-                    output_record = {
-                        'instruction': 'Please output the masked code blocks in the given assembly code. The code has been split into blocks based on control flow analysis, and some blocks have been masked with <MASK>. You need to reconstruct the original code by filling in the masked blocks.',
-                        'input': input_content,  # 包含split_lines、汇编语言和遮挡后的代码
-                        'output': '\n\n'.join(masked_blocks)  # 被遮挡的代码块作为输出
-                    }
-                    
-                    # 实时写入jsonl文件
-                    f.write(json.dumps(output_record, ensure_ascii=False) + '\n')
-                    f.flush()  # 确保立即写入磁盘
-                    
-                    processed_count += 1
-                    
-                    # 每处理100条记录显示一次进度
-                    if processed_count % 100 == 0:
-                        print(f"    已处理: {processed_count}/{len(results)} 条记录")
-                    
-                except Exception as e:
-                    print(f"    错误: 处理第{idx+1}条记录时出错: {e}")
-                    continue
-        
-        print(f"  文件处理完成，成功处理 {processed_count}/{len(results)} 条记录")
+        start_time = time.time()
+        processed_count = write_instruction_records(arrow_file_path, output_file, split_lines_map,
+                                                    output_format=output_format)
+        elapsed = time.time() - start_time
+
+        print(f"  文件处理完成，成功处理 {processed_count} 条记录")
         print(f"  结果已保存到: {output_file}")
-        
-        # 清理临时文件
-        os.unlink(temp_jsonl_path)
-        
+        print(f"  吞吐量: {format_throughput(processed_count, os.path.getsize(output_file), elapsed)}")
+
         return processed_count
-        
+
     except Exception as e:
         print(f"  错误: 处理文件 {arrow_file_path} 时出错: {e}")
         import traceback
@@ -341,4 +949,30 @@ def process_arrow_file(arrow_file_path, output_dir, split_lines_map):
         return 0
 
 if __name__ == '__main__':
-    main()
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='处理datasets目录下的所有.arrow文件，生成遮挡后的instruction数据')
+    arg_parser.add_argument('--datasets-dir', default='datasets')
+    arg_parser.add_argument('--all-blocks-dir', default='/home/featurize/data/all_blocks_jsons')
+    arg_parser.add_argument('--output-dir', default='/home/featurize/data/instructs')
+    arg_parser.add_argument('--workers', type=int, default=None, help='进程数，默认为CPU核数')
+    arg_parser.add_argument('--batches-per-task', type=int, default=BATCHES_PER_TASK,
+                            help='大文件按多少个RecordBatch切分为一个任务')
+    arg_parser.add_argument('--seed', type=int, default=None, help='随机遮挡的种子')
+    arg_parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='jsonl',
+                            help='jsonl 为 {instruction, input, output}；parquet/arrow 为列式存储')
+    arg_parser.add_argument('--write-batch-size', type=int, default=WRITE_BATCH_SIZE,
+                            help='每批写出的记录数，也是输出文件的flush与检查点间隔')
+    arg_parser.add_argument('--resume', action='store_true',
+                            help='根据输出目录中的 manifest.json 与检查点跳过已完成的部分继续处理')
+    args = arg_parser.parse_args()
+
+    main(datasets_dir=args.datasets_dir,
+         all_blocks_dir=args.all_blocks_dir,
+         output_dir=args.output_dir,
+         workers=args.workers,
+         batches_per_task=args.batches_per_task,
+         seed=args.seed,
+         output_format=args.output_format,
+         write_batch_size=args.write_batch_size,
+         resume=args.resume)
@@ -2,36 +2,157 @@ import pyarrow as pa
 import pyarrow.ipc as ipc
 import json
 import os
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def arrow_to_jsonl(arrow_path: str, jsonl_path: str):
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 输出压缩方式（流式压缩，由 pyarrow 完成）及对应的文件后缀
+COMPRESSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+# IPC file 格式的文件头；没有该文件头的按 IPC stream 格式读取
+ARROW_FILE_MAGIC = b'ARROW1'
+
+
+def iter_record_batches(arrow_path: str):
+    """memory_map 打开 .arrow 文件，自动识别 IPC file / stream 格式，逐个产出 RecordBatch（零拷贝）"""
+    with pa.memory_map(arrow_path, 'r') as source:
+        if source.read(len(ARROW_FILE_MAGIC)) == ARROW_FILE_MAGIC:
+            reader = ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+            return
+        source.seek(0)
+        with ipc.open_stream(source) as reader:
+            for batch in reader:
+                yield batch
+
+
+def encode_batch(batch) -> bytes:
+    """
+    将一个 RecordBatch 编码为 JSON Lines（UTF-8，不转义非ASCII字符）
+    字符串直接从 Arrow 缓冲区转换为 Python 对象后编码，不经过 pandas；安装了 orjson 时使用 orjson
+    """
+    rows = batch.to_pylist()
+    if orjson is not None:
+        try:
+            return b''.join(orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS)
+                            for row in rows)
+        except TypeError:
+            # orjson 不接受的内容（如孤立的代理字符、超出范围的整数）交给标准库处理
+            pass
+    return ''.join(json.dumps(row, ensure_ascii=False, default=str) + '\n' for row in rows).encode('utf-8')
+
+
+def open_output(jsonl_path: str, compression: str = None):
+    """打开输出文件，compression 为 gzip/zstd 时边写边压缩"""
+    if compression is None:
+        return open(jsonl_path, 'wb')
+    return pa.output_stream(jsonl_path, compression=compression)
+
+
+def arrow_to_jsonl(arrow_path: str, jsonl_path: str, compression: str = None):
     """
     将 .arrow 或 .arrowstream 文件转换为 .jsonl
     每一行是一条记录（dict → JSON 字符串）
-    """
-    if os.path.exists(jsonl_path):
-        os.remove(jsonl_path)          # 若目标文件已存在先删除，避免追加造成重复
+    文件通过 memory_map 读取，逐个 batch 编码后写出；编码全程持有 GIL，并行只在进程级别（convert_shards）
+
+    Args:
+        compression: None、'gzip' 或 'zstd'
 
+    Returns:
+        tuple: (记录数, 未压缩的JSON字节数)
+    """
     batches = 0
     rows    = 0
+    num_bytes = 0
 
-    with pa.OSFile(arrow_path, 'rb') as source, \
-         ipc.RecordBatchStreamReader(source) as reader, \
-         open(jsonl_path, 'a', encoding='utf-8') as sink:
+    with open_output(jsonl_path, compression) as sink:
+        for batch in iter_record_batches(arrow_path):
+            data = encode_batch(batch)
+            sink.write(data)
+            num_bytes += len(data)
+            batches += 1
+            rows    += batch.num_rows
 
-        for batch in reader:
-            # 将本批次 Arrow RecordBatch 转成 pandas.DataFrame
-            df = batch.to_pandas()
+    print(f'✅ 已写出 {rows} 条记录（{batches} 个 batch）到 {jsonl_path}')
+    return rows, num_bytes
 
-            # orient='records' → List[dict]; lines=True → 每条记录结尾带 '\n'
-            json_str = df.to_json(orient='records', lines=True, force_ascii=False)
-            sink.write(json_str)       # 直接写入文件
 
-            batches += 1
-            rows    += len(df)
+def output_path_for(arrow_path: str, output_dir: str = None, compression: str = None) -> str:
+    """shard 对应的输出路径：与输入同名的 .jsonl（可加压缩后缀），默认与输入放在同一目录"""
+    stem = os.path.splitext(os.path.basename(arrow_path))[0]
+    return os.path.join(output_dir or os.path.dirname(arrow_path), stem + '.jsonl' + COMPRESSIONS[compression])
 
-    print(f'✅ 已写出 {rows} 条记录（{batches} 个 batch）到 {jsonl_path}')
 
-# 示例调用
-arrow_file = "data-00000-of-00017.arrow"
-jsonl_file = "data-00000-of-00017.jsonl"
-arrow_to_jsonl(arrow_file, jsonl_file)
\ No newline at end of file
+def format_throughput(rows: int, num_bytes: int, elapsed: float) -> str:
+    elapsed = max(elapsed, 1e-9)
+    return f'{rows / elapsed:.0f} 条/秒, {num_bytes / elapsed / 1024 / 1024:.1f} MB/秒'
+
+
+def convert_shard(arrow_path: str, output_dir: str = None, compression: str = None):
+    """
+    转换单个 shard（在进程池中运行），内存占用只与单个 batch 大小相关
+
+    Returns:
+        tuple: (输入路径, 输出路径, 记录数, 未压缩字节数, 耗时秒数)
+    """
+    jsonl_path = output_path_for(arrow_path, output_dir, compression)
+    start = time.time()
+    rows, num_bytes = arrow_to_jsonl(arrow_path, jsonl_path, compression)
+    return arrow_path, jsonl_path, rows, num_bytes, time.time() - start
+
+
+def convert_shards(patterns, output_dir: str = None, workers: int = None, compression: str = None):
+    """
+    按 glob 匹配所有 shard，多进程并行转换，打印每个 shard 与总体的吞吐量
+
+    Args:
+        patterns: glob 模式列表（支持 **）
+        output_dir: 输出目录，默认与输入放在同一目录
+        workers: 进程数，默认为CPU核数（不超过 shard 数）
+        compression: None、'gzip' 或 'zstd'
+    """
+    arrow_paths = sorted({path for pattern in patterns for path in glob.glob(pattern, recursive=True)})
+    if not arrow_paths:
+        print(f'未找到匹配 {patterns} 的 .arrow 文件')
+        return
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(arrow_paths)))
+
+    print(f'转换 {len(arrow_paths)} 个 shard，{workers} 个进程')
+    start = time.time()
+    total_rows = 0
+    total_bytes = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(convert_shard, path, output_dir, compression) for path in arrow_paths]
+        for future in as_completed(futures):
+            arrow_path, jsonl_path, rows, num_bytes, elapsed = future.result()
+            total_rows += rows
+            total_bytes += num_bytes
+            output_size = os.path.getsize(jsonl_path)
+            print(f'  {os.path.basename(arrow_path)} -> {jsonl_path}: {rows} 条, '
+                  f'{format_throughput(rows, num_bytes, elapsed)}, 输出 {output_size / 1024 / 1024:.1f} MB')
+
+    elapsed = time.time() - start
+    print(f'✅ 共 {len(arrow_paths)} 个 shard，{total_rows} 条记录，耗时 {elapsed:.1f} 秒，'
+          f'{format_throughput(total_rows, total_bytes, elapsed)}（按未压缩JSON计）')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='将 .arrow shard 转换为 .jsonl（多进程，可选流式压缩）')
+    arg_parser.add_argument('patterns', nargs='*', default=['data-00000-of-00017.arrow'],
+                            help='shard 路径或 glob 模式，如 "datasets/**/data-*.arrow"')
+    arg_parser.add_argument('--output-dir', default=None, help='输出目录，默认与输入放在同一目录')
+    arg_parser.add_argument('--workers', type=int, default=None, help='进程数，默认为CPU核数')
+    arg_parser.add_argument('--compression', choices=[c for c in COMPRESSIONS if c], default=None)
+    args = arg_parser.parse_args()
+
+    convert_shards(args.patterns, output_dir=args.output_dir, workers=args.workers, compression=args.compression)
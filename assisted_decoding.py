@@ -0,0 +1,145 @@
+"""
+辅助解码（投机解码）：先廉价地提出若干候选 token，再由主模型一次前向验证，贪心结果与普通解码一致
+
+遮挡代码块的输出常常与 prompt 中的代码行、汇编几乎相同，两种提议方式：
+- prompt_lookup：在 prompt（遮挡后的代码与汇编）中匹配最近生成的 n-gram，把其后的 token 作为候选
+- draft：用一个共享词表的小模型提出候选（词表不同时传入 draft_tokenizer）
+均使用 transformers generate 内置的辅助生成（只支持每次一条，多条时逐条生成）。
+
+统计：在主模型上注册 forward pre-hook，记录每次验证前向输入的 token 数，
+候选数 = 输入 token 数 - 未缓存的 token 数，接受数 = 生成的 token 数 - 验证次数。
+
+用法（CPU 上的随机小模型，比较普通解码 / prompt_lookup / 以主模型副本为 draft 的吞吐，并检查结果一致）：
+python assisted_decoding.py
+"""
+import time
+
+# prompt_lookup 每次提出的候选 token 数与匹配的最长 n-gram
+PROMPT_LOOKUP_NUM_TOKENS = 10
+PROMPT_LOOKUP_MAX_NGRAM = 3
+
+ASSISTED_MODES = ('prompt_lookup', 'draft')
+
+
+class AssistedDecoder:
+    """
+    :param mode: 'prompt_lookup' 或 'draft'
+    :param draft_model: mode 为 draft 时的小模型
+    :param tokenizer / draft_tokenizer: 主模型与小模型的 tokenizer，只在两者词表不同时需要
+    """
+
+    def __init__(self, model, mode='prompt_lookup', draft_model=None, tokenizer=None, draft_tokenizer=None,
+                 num_tokens=PROMPT_LOOKUP_NUM_TOKENS, max_ngram=PROMPT_LOOKUP_MAX_NGRAM):
+        if mode not in ASSISTED_MODES:
+            raise ValueError(f"未知的辅助解码方式: {mode}")
+        if mode == 'draft' and draft_model is None:
+            raise ValueError("draft 模式需要 draft_model")
+        self.mode = mode
+        self.draft_model = draft_model
+        self.tokenizer = tokenizer
+        self.draft_tokenizer = draft_tokenizer
+        self.num_tokens = num_tokens
+        self.max_ngram = max_ngram
+        self.requests = 0
+        self.generated = 0
+        self.steps = 0
+        self.proposed = 0
+        self.accepted = 0
+        self.elapsed = 0.0
+        self._forward_lengths = None
+        # PeftModel 的 generate 会调用基座模型，hook 注册在实际执行前向的模型上
+        target = model.get_base_model() if hasattr(model, 'get_base_model') else model
+        target.register_forward_pre_hook(self._on_forward, with_kwargs=True)
+
+    def _on_forward(self, module, args, kwargs):
+        if self._forward_lengths is not None:
+            input_ids = kwargs.get('input_ids', args[0] if args else None)
+            if input_ids is not None:
+                self._forward_lengths.append(input_ids.shape[1])
+
+    def generate_kwargs(self):
+        if self.mode == 'prompt_lookup':
+            return {'prompt_lookup_num_tokens': self.num_tokens, 'max_matching_ngram_size': self.max_ngram}
+        kwargs = {'assistant_model': self.draft_model}
+        if self.draft_tokenizer is not None:
+            kwargs.update(tokenizer=self.tokenizer, assistant_tokenizer=self.draft_tokenizer)
+        return kwargs
+
+    def begin(self):
+        self._forward_lengths = []
+        self._start = time.perf_counter()
+
+    def record(self, uncached_length, num_generated):
+        """一次 generate 结束：uncached_length 为 prompt 中不在 KV cache 里的 token 数"""
+        self.elapsed += time.perf_counter() - self._start
+        lengths, self._forward_lengths = self._forward_lengths, None
+        if not lengths:
+            return
+        self.requests += 1
+        self.generated += num_generated
+        self.steps += len(lengths)
+        self.proposed += max(0, lengths[0] - uncached_length) + sum(length - 1 for length in lengths[1:])
+        self.accepted += max(0, num_generated - len(lengths))
+
+    def stats(self):
+        return (f"辅助解码({self.mode}): {self.requests} 条，生成 {self.generated} tokens，"
+                f"主模型前向 {self.steps} 次（每次 {self.generated / max(self.steps, 1):.2f} tokens），"
+                f"候选接受率 {self.accepted / max(self.proposed, 1):.1%}，"
+                f"{self.generated / max(self.elapsed, 1e-9):.1f} tokens/秒")
+
+
+def build_assisted_decoder(model, tokenizer, mode, draft_model_path=None):
+    """按命令行参数创建辅助解码器：mode 为 None 时返回 None；draft 模式加载小模型，词表不同时同时加载它的 tokenizer"""
+    if mode is None:
+        return None
+    if mode == 'prompt_lookup':
+        return AssistedDecoder(model, mode)
+    if draft_model_path is None:
+        raise ValueError("draft 模式需要指定 --draft-model-path")
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    draft_model = AutoModelForCausalLM.from_pretrained(draft_model_path, device_map="auto", torch_dtype=torch.bfloat16,
+                                                       trust_remote_code=True).eval()
+    draft_tokenizer = AutoTokenizer.from_pretrained(draft_model_path, trust_remote_code=True)
+    if draft_tokenizer.get_vocab() == tokenizer.get_vocab():
+        return AssistedDecoder(model, mode, draft_model=draft_model)
+    return AssistedDecoder(model, mode, draft_model=draft_model, tokenizer=tokenizer, draft_tokenizer=draft_tokenizer)
+
+
+def benchmark(num_requests=8, new_tokens=48):
+    """随机小模型上比较 普通解码 / prompt_lookup / draft（draft 为主模型的副本，接受率应为100%）"""
+    import copy
+    import random
+    from inference_server import build_tiny_model
+    from reasoning_llm import generate_batch
+
+    model, tokenizer = build_tiny_model()
+    # 在注册 hook 之前复制
+    draft_model = copy.deepcopy(model)
+    rng = random.Random(0)
+    code = '\n'.join(f'    x{i} = x{i - 1} + {rng.randint(0, 9)};' for i in range(1, 24))
+    prompts = [tokenizer.encode(f'Masked code:\n{code}\nAssembly language: mov eax, {i}\n') for i in range(num_requests)]
+
+    start = time.perf_counter()
+    baseline = [generate_batch(model, tokenizer, [ids], new_tokens)[0] for ids in prompts]
+    baseline_time = time.perf_counter() - start
+    generated = sum(map(len, baseline))
+    print(f"  普通解码: {generated} tokens，{generated / baseline_time:.1f} tokens/秒")
+
+    for decoder in (AssistedDecoder(model, 'prompt_lookup'), AssistedDecoder(model, 'draft', draft_model=draft_model)):
+        start = time.perf_counter()
+        outputs = [generate_batch(model, tokenizer, [ids], new_tokens, assisted=decoder)[0] for ids in prompts]
+        elapsed = time.perf_counter() - start
+        same = sum(a == b for a, b in zip(outputs, baseline))
+        print(f"  {decoder.stats()}，加速 {baseline_time / elapsed:.2f}x，结果一致 {same}/{len(prompts)}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='辅助解码的接受率与加速基准（CPU 上的随机小模型）')
+    arg_parser.add_argument('--requests', type=int, default=8)
+    arg_parser.add_argument('--new-tokens', type=int, default=48)
+    args = arg_parser.parse_args()
+    benchmark(args.requests, args.new_tokens)
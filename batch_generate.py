@@ -0,0 +1,136 @@
+"""
+离线批量生成：流式读取 JSONL 中的 prompt，按长度排序分批 generate，逐批追加写出结果
+
+每行一个请求：{"id": ..., "prompt": "..."}、{"id": ..., "messages": [...]} 或
+{"instruction": ..., "input": ...}（如 example.jsonl）；没有 id/request_id 时以行号为 id。
+输出每行 {"id", "text", "num_tokens"}，按完成顺序追加。中断后重新运行同一命令即可续跑：
+已写出的 id 会被跳过，最后一行若只写了一半会先被截掉。
+
+用法：
+python batch_generate.py example.jsonl outputs.jsonl --batch-size 8
+python batch_generate.py example.jsonl outputs.jsonl --tiny    # CPU 上的随机小模型
+"""
+import os
+import json
+import time
+from reasoning_llm import (model_path, lora_path, merged_path, MAX_NEW_TOKENS, load_model, load_merged_model,
+                           encode_messages, payload_messages, generate_batch)
+from inference_server import format_response, build_tiny_model
+from assisted_decoding import ASSISTED_MODES, build_assisted_decoder
+
+BATCH_SIZE = 8
+
+# 每次读入 BATCH_SIZE * SORT_WINDOW 条请求，在窗口内按 prompt 长度排序后分批
+SORT_WINDOW = 32
+
+
+def request_id_of(record, line_no):
+    return record.get('id', record.get('request_id', line_no))
+
+
+def load_completed_ids(output_path):
+    """读取已写出结果的 id；末尾不完整的一行（中断时写了一半）会被截掉"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        if line.strip():
+            completed.add(json.loads(line)['id'])
+    return completed
+
+
+def iter_requests(input_path, completed):
+    """逐行产出 (id, 请求)，跳过已完成的 id"""
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            request_id = request_id_of(record, line_no)
+            if request_id not in completed:
+                yield request_id, record
+
+
+def iter_windows(requests, size):
+    window = []
+    for item in requests:
+        window.append(item)
+        if len(window) >= size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+
+def batch_generate(model, tokenizer, input_path, output_path, batch_size=BATCH_SIZE,
+                   max_new_tokens=MAX_NEW_TOKENS, sort_window=SORT_WINDOW, prefix_cache=None, assisted=None):
+    completed = load_completed_ids(output_path)
+    if completed:
+        print(f"续跑：跳过已完成的 {len(completed)} 条")
+
+    start = time.time()
+    num_requests = 0
+    num_tokens = 0
+    with open(output_path, 'a', encoding='utf-8') as out:
+        for window in iter_windows(iter_requests(input_path, completed), batch_size * sort_window):
+            encoded = [(request_id, encode_messages(tokenizer, payload_messages(record)),
+                        record.get('max_new_tokens', max_new_tokens))
+                       for request_id, record in window]
+            encoded.sort(key=lambda item: len(item[1]))
+            for i in range(0, len(encoded), batch_size):
+                batch = encoded[i:i + batch_size]
+                outputs = generate_batch(model, tokenizer, [ids for _, ids, _ in batch], [n for _, _, n in batch],
+                                         prefix_cache=prefix_cache, assisted=assisted)
+                # 一批的结果一次写出并落盘，中断最多丢失正在生成的一批
+                out.write(''.join(json.dumps(format_response(tokenizer, request_id, ids), ensure_ascii=False) + '\n'
+                                  for (request_id, _, _), ids in zip(batch, outputs)))
+                out.flush()
+                os.fsync(out.fileno())
+                num_requests += len(batch)
+                num_tokens += sum(len(ids) for ids in outputs)
+            elapsed = max(time.time() - start, 1e-9)
+            print(f"已完成 {num_requests} 条，生成 {num_tokens} tokens，{num_tokens / elapsed:.1f} tokens/秒")
+    print(f"✅ 本次生成 {num_requests} 条，结果写入 {output_path}")
+    if prefix_cache is not None:
+        print(prefix_cache.stats())
+    if assisted is not None:
+        print(assisted.stats())
+
+
+if __name__ == '__main__':
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='离线批量生成（可续跑）')
+    arg_parser.add_argument('input_path')
+    arg_parser.add_argument('output_path')
+    arg_parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    arg_parser.add_argument('--max-new-tokens', type=int, default=MAX_NEW_TOKENS)
+    arg_parser.add_argument('--sort-window', type=int, default=SORT_WINDOW, help='每次排序的批数')
+    arg_parser.add_argument('--model-path', default=model_path)
+    arg_parser.add_argument('--lora-path', default=lora_path, help='为空字符串时不加载lora')
+    arg_parser.add_argument('--merged', nargs='?', const=merged_path, default=None,
+                            help='加载 merge_lora.py 导出的合并模型（可指定目录）')
+    arg_parser.add_argument('--tiny', action='store_true', help='使用随机初始化的小模型（CPU测试）')
+    arg_parser.add_argument('--prefix-cache', action='store_true', help='复用公共 prompt 前缀的 KV cache')
+    arg_parser.add_argument('--assisted', choices=ASSISTED_MODES, default=None, help='辅助解码方式')
+    arg_parser.add_argument('--draft-model-path', default=None, help='--assisted draft 使用的小模型')
+    args = arg_parser.parse_args()
+
+    if args.tiny:
+        model, tokenizer = build_tiny_model()
+    elif args.merged:
+        model, tokenizer = load_merged_model(args.merged)
+    else:
+        model, tokenizer = load_model(args.model_path, args.lora_path or None)
+    prefix_cache = None
+    if args.prefix_cache:
+        from prefix_cache import PrefixKVCache
+        prefix_cache = PrefixKVCache()
+    assisted = build_assisted_decoder(model, tokenizer, args.assisted, args.draft_model_path)
+    batch_generate(model, tokenizer, args.input_path, args.output_path, args.batch_size, args.max_new_tokens,
+                   args.sort_window, prefix_cache, assisted)
@@ -0,0 +1,341 @@
+"""
+常驻推理服务：模型与lora只加载一次，排队的请求动态合批后一次 generate
+
+合批策略：等最早的请求最多 max_wait_ms，取出队列中所有请求，以最早的请求为准，
+再挑 prompt 长度与它最接近的请求凑满一批（左侧补齐，批内长度接近、补齐少）。
+每批结束后统计生成吞吐（tokens/秒）、补齐比例与排队延迟。
+
+用法：
+1. JSONL（标准输入每行一个请求，按完成顺序输出到标准输出）
+   python inference_server.py --mode jsonl < prompts.jsonl
+   请求: {"id": ..., "prompt": "..."}、{"id": ..., "messages": [...]} 或 {"instruction", "input"}，可选 "max_new_tokens"
+2. 本地HTTP
+   python inference_server.py --mode http --port 8000
+   POST /generate 请求体同上，GET /stats 返回统计
+3. CPU 上的随机初始化小模型（不需要下载权重，用于测试合批与统计）
+   python inference_server.py --tiny --mode jsonl < prompts.jsonl
+"""
+import sys
+import json
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from assisted_decoding import ASSISTED_MODES, build_assisted_decoder
+from reasoning_llm import (model_path, lora_path, merged_path, MAX_NEW_TOKENS, load_model, load_merged_model,
+                           encode_messages, payload_messages, generate_batch)
+
+# 每批最多请求数，最早的请求最多等待的毫秒数
+MAX_BATCH_SIZE = 8
+MAX_WAIT_MS = 20
+
+# 每处理多少批打印一次统计
+STATS_EVERY = 10
+
+
+class Request:
+    __slots__ = ('prompt_ids', 'max_new_tokens', 'submitted', 'future')
+
+    def __init__(self, prompt_ids, max_new_tokens):
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.submitted = time.perf_counter()
+        self.future = Future()
+
+
+class ServerStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.padding_tokens = 0
+        self.generated_tokens = 0
+        self.generate_time = 0.0
+        self.queue_latencies = []
+
+    def record(self, batch, outputs, elapsed, started):
+        max_len = max(len(r.prompt_ids) for r in batch)
+        with self.lock:
+            self.batches += 1
+            self.requests += len(batch)
+            self.prompt_tokens += sum(len(r.prompt_ids) for r in batch)
+            self.padding_tokens += sum(max_len - len(r.prompt_ids) for r in batch)
+            self.generated_tokens += sum(len(ids) for ids in outputs)
+            self.generate_time += elapsed
+            self.queue_latencies.extend(started - r.submitted for r in batch)
+
+    def to_dict(self):
+        with self.lock:
+            latencies = sorted(self.queue_latencies)
+
+            def percentile(p):
+                return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+            return {
+                'batches': self.batches,
+                'requests': self.requests,
+                'mean_batch_size': self.requests / max(self.batches, 1),
+                'generated_tokens': self.generated_tokens,
+                'tokens_per_second': self.generated_tokens / max(self.generate_time, 1e-9),
+                'padding_ratio': self.padding_tokens / max(self.prompt_tokens + self.padding_tokens, 1),
+                'queue_ms_p50': percentile(0.5),
+                'queue_ms_p95': percentile(0.95),
+                'queue_ms_max': latencies[-1] * 1000 if latencies else 0.0,
+            }
+
+    def report(self):
+        s = self.to_dict()
+        return (f"{s['requests']} 个请求 / {s['batches']} 批（平均 {s['mean_batch_size']:.1f}），"
+                f"生成 {s['generated_tokens']} tokens，{s['tokens_per_second']:.1f} tokens/秒，"
+                f"补齐 {s['padding_ratio']:.1%}，排队延迟 p50 {s['queue_ms_p50']:.0f} ms / "
+                f"p95 {s['queue_ms_p95']:.0f} ms / max {s['queue_ms_max']:.0f} ms")
+
+
+class InferenceServer:
+    """
+    动态合批的推理服务，submit 返回 Future，由后台线程按批调用 generate_batch
+
+    :param max_batch_size: 每批最多请求数
+    :param max_wait_ms: 凑批时最早的请求最多等待的毫秒数
+    :param prefix_cache: PrefixKVCache，复用公共前缀的 KV（None 表示不使用）
+    :param assisted: AssistedDecoder，辅助解码（批内逐条生成）
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 stats_every=STATS_EVERY, prefix_cache=None, assisted=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix_cache = prefix_cache
+        self.assisted = assisted
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats_every = stats_every
+        self.stats = ServerStats()
+        self._queue = queue.Queue()
+        self._pending = []
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """处理完已提交的请求后停止"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def submit(self, prompt_ids, max_new_tokens=MAX_NEW_TOKENS):
+        request = Request(list(prompt_ids), max_new_tokens)
+        self._queue.put(request)
+        return request.future
+
+    def submit_request(self, payload):
+        """JSON 请求（prompt、messages 或 instruction/input）-> Future，结果为 token ids"""
+        return self.submit(encode_messages(self.tokenizer, payload_messages(payload)),
+                           payload.get('max_new_tokens', MAX_NEW_TOKENS))
+
+    def _take(self, block, timeout=None):
+        try:
+            item = self._queue.get(block=block, timeout=timeout)
+        except queue.Empty:
+            return False
+        if item is None:
+            self._stopping = True
+            return False
+        self._pending.append(item)
+        return True
+
+    def _next_batch(self):
+        while not self._pending:
+            if self._stopping or not self._take(block=True):
+                if self._stopping and not self._pending:
+                    return None
+        deadline = self._pending[0].submitted + self.max_wait
+        while not self._stopping and len(self._pending) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0 or not self._take(block=True, timeout=timeout):
+                break
+        while not self._stopping and self._take(block=False):
+            pass
+
+        oldest = self._pending[0]
+        others = sorted(self._pending[1:], key=lambda r: abs(len(r.prompt_ids) - len(oldest.prompt_ids)))
+        batch = [oldest] + others[:self.max_batch_size - 1]
+        chosen = set(map(id, batch))
+        self._pending = [r for r in self._pending if id(r) not in chosen]
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            started = time.perf_counter()
+            try:
+                outputs = generate_batch(self.model, self.tokenizer, [r.prompt_ids for r in batch],
+                                         [r.max_new_tokens for r in batch], prefix_cache=self.prefix_cache,
+                                         assisted=self.assisted)
+            except Exception as e:
+                for r in batch:
+                    r.future.set_exception(e)
+                continue
+            self.stats.record(batch, outputs, time.perf_counter() - started, started)
+            for r, ids in zip(batch, outputs):
+                r.future.set_result(ids)
+            if self.stats.batches % self.stats_every == 0:
+                print(self.stats.report(), file=sys.stderr)
+
+
+def format_response(tokenizer, request_id, ids):
+    return {'id': request_id, 'text': tokenizer.decode(ids, skip_special_tokens=True), 'num_tokens': len(ids)}
+
+
+def serve_jsonl(server, input_stream=sys.stdin, output_stream=sys.stdout):
+    """逐行读取请求并立即提交（读取与生成重叠），结果按完成顺序写出"""
+    write_lock = threading.Lock()
+    futures = []
+
+    def write_result(request_id, future):
+        try:
+            record = format_response(server.tokenizer, request_id, future.result())
+        except Exception as e:
+            record = {'id': request_id, 'error': str(e)}
+        with write_lock:
+            output_stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+            output_stream.flush()
+
+    for line in input_stream:
+        if not line.strip():
+            continue
+        payload = json.loads(line)
+        future = server.submit_request(payload)
+        request_id = payload.get('id', len(futures))
+        future.add_done_callback(lambda f, request_id=request_id: write_result(request_id, f))
+        futures.append(future)
+    for future in futures:
+        future.exception()
+
+
+def serve_http(server, host='127.0.0.1', port=8000):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self._send_json(200, server.stats.to_dict())
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/generate':
+                self._send_json(404, {'error': 'not found'})
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                start = time.perf_counter()
+                ids = server.submit_request(payload).result()
+            except Exception as e:
+                self._send_json(400, {'error': str(e)})
+                return
+            response = format_response(server.tokenizer, payload.get('id'), ids)
+            response['latency_ms'] = (time.perf_counter() - start) * 1000
+            self._send_json(200, response)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    print(f"推理服务已启动: http://{host}:{port}/generate", file=sys.stderr)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+class ByteTokenizer:
+    """按 UTF-8 字节编码的最小 tokenizer（配合 --tiny 的随机模型使用）"""
+    pad_token_id = 0
+    eos_token_id = 1
+    bos_token_id = 2
+    chat_template = None
+    OFFSET = 3
+
+    def encode(self, text, add_special_tokens=False):
+        ids = [b + self.OFFSET for b in text.encode('utf-8')]
+        return [self.bos_token_id] + ids if add_special_tokens else ids
+
+    def decode(self, ids, skip_special_tokens=True):
+        return bytes(i - self.OFFSET for i in ids if i >= self.OFFSET).decode('utf-8', 'replace')
+
+
+def build_tiny_model(seed=0):
+    """随机初始化的小 Llama 模型（CPU）"""
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(seed)
+    tokenizer = ByteTokenizer()
+    config = LlamaConfig(vocab_size=256 + ByteTokenizer.OFFSET, hidden_size=64, intermediate_size=128,
+                         num_hidden_layers=2, num_attention_heads=4, num_key_value_heads=4,
+                         max_position_embeddings=4096, pad_token_id=tokenizer.pad_token_id,
+                         eos_token_id=tokenizer.eos_token_id, bos_token_id=tokenizer.bos_token_id)
+    return LlamaForCausalLM(config).eval(), tokenizer
+
+
+if __name__ == '__main__':
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='动态合批的常驻推理服务')
+    arg_parser.add_argument('--mode', choices=['jsonl', 'http'], default='jsonl')
+    arg_parser.add_argument('--model-path', default=model_path)
+    arg_parser.add_argument('--lora-path', default=lora_path, help='为空字符串时不加载lora')
+    arg_parser.add_argument('--merged', nargs='?', const=merged_path, default=None,
+                            help='加载 merge_lora.py 导出的合并模型（可指定目录）')
+    arg_parser.add_argument('--tiny', action='store_true', help='使用随机初始化的小模型（CPU测试）')
+    arg_parser.add_argument('--prefix-cache', action='store_true', help='复用公共 prompt 前缀的 KV cache')
+    arg_parser.add_argument('--assisted', choices=ASSISTED_MODES, default=None, help='辅助解码方式')
+    arg_parser.add_argument('--draft-model-path', default=None, help='--assisted draft 使用的小模型')
+    arg_parser.add_argument('--max-batch-size', type=int, default=MAX_BATCH_SIZE)
+    arg_parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS)
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8000)
+    args = arg_parser.parse_args()
+
+    if args.tiny:
+        model, tokenizer = build_tiny_model()
+    elif args.merged:
+        model, tokenizer = load_merged_model(args.merged)
+    else:
+        model, tokenizer = load_model(args.model_path, args.lora_path or None)
+
+    prefix_cache = None
+    if args.prefix_cache:
+        from prefix_cache import PrefixKVCache
+        prefix_cache = PrefixKVCache()
+    assisted = build_assisted_decoder(model, tokenizer, args.assisted, args.draft_model_path)
+    server = InferenceServer(model, tokenizer, args.max_batch_size, args.max_wait_ms,
+                             prefix_cache=prefix_cache, assisted=assisted).start()
+    try:
+        if args.mode == 'jsonl':
+            serve_jsonl(server)
+        else:
+            serve_http(server, args.host, args.port)
+    finally:
+        server.stop()
+        print(server.stats.report(), file=sys.stderr)
+        if prefix_cache is not None:
+            print(prefix_cache.stats(), file=sys.stderr)
+        if assisted is not None:
+            print(assisted.stats(), file=sys.stderr)
@@ -0,0 +1,144 @@
+"""
+把 lora 权重合并进基座模型并导出为单个 safetensors 文件
+
+reasoning_llm.py 每次启动都要先加载基座模型再套 PeftModel，前向时每个目标层还要额外计算一次 lora 分支。
+合并后推理只需 reasoning_llm.load_merged_model(): 模型骨架在 meta 设备上构建，
+memory_map 的 model.safetensors 直接赋给参数，不经过随机初始化和额外拷贝。
+
+用法：
+python merge_lora.py                      # 导出到 ./output/deepseek_coder_v2_merged
+python merge_lora.py --benchmark          # 比较 合并 / 未合并 的加载时间与每token延迟
+python merge_lora.py --benchmark --tiny   # CPU 上用随机初始化的小模型和随机lora测试
+"""
+import os
+import time
+import shutil
+import tempfile
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+from peft import LoraConfig, PeftModel, TaskType, get_peft_model
+from reasoning_llm import model_path, lora_path, merged_path
+
+# 不分片：整个模型保存为一个 model.safetensors
+SINGLE_SHARD = '10000GB'
+
+# 每token延迟的测量：prompt 长度、生成的 token 数、重复次数（取最快一次）
+BENCH_PROMPT_LENGTH = 32
+BENCH_NEW_TOKENS = 64
+BENCH_REPEAT = 3
+
+
+def save_merged(model, output_dir, tokenizer=None):
+    """保存为单个 model.safetensors + config（以及 tokenizer），先写临时目录再改名"""
+    tmp_dir = output_dir.rstrip('/') + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    model.save_pretrained(tmp_dir, safe_serialization=True, max_shard_size=SINGLE_SHARD)
+    if tokenizer is not None:
+        tokenizer.save_pretrained(tmp_dir)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+
+
+def merge_lora(model_path=model_path, lora_path=lora_path, output_dir=merged_path, dtype=torch.bfloat16):
+    """加载基座模型与lora，merge_and_unload 后导出"""
+    start = time.time()
+    tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=dtype, trust_remote_code=True,
+                                                 low_cpu_mem_usage=True)
+    model = PeftModel.from_pretrained(model, model_id=lora_path)
+    merged = model.merge_and_unload()
+    save_merged(merged, output_dir, tokenizer)
+    print(f"✅ 合并模型已导出到 {output_dir}，耗时 {time.time() - start:.1f} 秒")
+
+
+def load_unmerged(model_path, lora_path, dtype, device_map):
+    model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=dtype, device_map=device_map,
+                                                 trust_remote_code=True)
+    return PeftModel.from_pretrained(model, model_id=lora_path).eval()
+
+
+def load_merged(merged_path, dtype, device_map):
+    return AutoModelForCausalLM.from_pretrained(merged_path, torch_dtype=dtype, device_map=device_map,
+                                                trust_remote_code=True, low_cpu_mem_usage=True).eval()
+
+
+def per_token_latency(model, input_ids):
+    """贪心生成 BENCH_NEW_TOKENS 个 token（不提前停止）的每token耗时，取最快一次"""
+    best = float('inf')
+    for _ in range(BENCH_REPEAT):
+        start = time.perf_counter()
+        with torch.inference_mode():
+            model.generate(input_ids=input_ids, attention_mask=torch.ones_like(input_ids),
+                           max_new_tokens=BENCH_NEW_TOKENS, min_new_tokens=BENCH_NEW_TOKENS, do_sample=False,
+                           pad_token_id=model.config.pad_token_id or 0)
+        best = min(best, time.perf_counter() - start)
+    return best / BENCH_NEW_TOKENS
+
+
+def benchmark(model_path=model_path, lora_path=lora_path, merged_path=merged_path, dtype=torch.bfloat16,
+              device_map="auto"):
+    """比较 合并 / 未合并 的加载时间与每token延迟，并检查两者的 logits 一致"""
+    results = {}
+    for label, load in (('未合并 (PeftModel)', lambda: load_unmerged(model_path, lora_path, dtype, device_map)),
+                        ('合并', lambda: load_merged(merged_path, dtype, device_map))):
+        start = time.perf_counter()
+        model = load()
+        load_time = time.perf_counter() - start
+        generator = torch.Generator().manual_seed(0)
+        input_ids = torch.randint(3, model.config.vocab_size, (1, BENCH_PROMPT_LENGTH), generator=generator)
+        input_ids = input_ids.to(model.device)
+        with torch.inference_mode():
+            logits = model(input_ids=input_ids).logits.float().cpu()
+        latency = per_token_latency(model, input_ids)
+        results[label] = logits
+        print(f"  {label:<20}加载 {load_time:6.2f} 秒，每token {latency * 1000:7.2f} ms")
+        del model
+
+    unmerged_logits, merged_logits = results.values()
+    max_diff = (unmerged_logits - merged_logits).abs().max().item()
+    print(f"  logits 最大差异: {max_diff:.2e}")
+
+
+def build_tiny_checkpoints(work_dir):
+    """随机初始化的小模型 + 随机lora（B 不为0，合并确实改变权重），并导出合并模型"""
+    from inference_server import build_tiny_model
+
+    base_dir = os.path.join(work_dir, 'base')
+    tiny_lora_dir = os.path.join(work_dir, 'lora')
+    tiny_merged_dir = os.path.join(work_dir, 'merged')
+    model, _ = build_tiny_model()
+    model.save_pretrained(base_dir)
+    config = LoraConfig(
+        task_type=TaskType.CAUSAL_LM,
+        target_modules=["q_proj", "k_proj", "v_proj", "o_proj", 'gate_proj', 'up_proj', 'down_proj'],
+        r=8,
+        lora_alpha=32,
+        init_lora_weights=False
+    )
+    get_peft_model(model, config).save_pretrained(tiny_lora_dir)
+    merged = load_unmerged(base_dir, tiny_lora_dir, torch.float32, None).merge_and_unload()
+    save_merged(merged, tiny_merged_dir)
+    return base_dir, tiny_lora_dir, tiny_merged_dir
+
+
+if __name__ == '__main__':
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='合并lora权重并导出单个 safetensors 文件')
+    arg_parser.add_argument('--model-path', default=model_path)
+    arg_parser.add_argument('--lora-path', default=lora_path)
+    arg_parser.add_argument('--output-dir', default=merged_path)
+    arg_parser.add_argument('--benchmark', action='store_true', help='比较合并前后的加载时间与每token延迟')
+    arg_parser.add_argument('--tiny', action='store_true', help='基准测试使用随机初始化的小模型（CPU）')
+    args = arg_parser.parse_args()
+
+    if args.benchmark and args.tiny:
+        with tempfile.TemporaryDirectory() as work_dir:
+            base_dir, tiny_lora_dir, tiny_merged_dir = build_tiny_checkpoints(work_dir)
+            benchmark(base_dir, tiny_lora_dir, tiny_merged_dir, torch.float32, None)
+    elif args.benchmark:
+        if not os.path.exists(args.output_dir):
+            merge_lora(args.model_path, args.lora_path, args.output_dir)
+        benchmark(args.model_path, args.lora_path, args.output_dir)
+    else:
+        merge_lora(args.model_path, args.lora_path, args.output_dir)
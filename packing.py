@@ -0,0 +1,98 @@
+"""
+样本打包：把多条分词后的样本装进固定长度的序列，以及打包序列的 collator
+
+打包后的序列中多条样本首尾相接，训练时必须保证样本之间互不可见：
+- block_diagonal=True（默认）：collator 输出四维的块对角因果掩码 (batch, 1, L, L)，1 为可见、0 为不可见，
+  由模型代码中的 _prepare_4d_causal_attention_mask 取反为加性掩码。适用于 eager/sdpa 注意力，
+  DeepSeek 的 remote code（trust_remote_code）必须使用这种方式
+- block_diagonal=False：不输出 attention_mask，只输出每条样本从0开始的 position_ids。
+  只有 transformers 内置模型的 flash_attention_2 会在没有 attention_mask 时按 position_ids
+  切分样本边界（flash_attn_varlen_func）；其他注意力实现下样本之间会相互可见
+"""
+from bisect import bisect_left, insort
+
+
+def plan_packing(lengths, pack_length):
+    """
+    best-fit decreasing：按长度从长到短，每条样本放进剩余空间最小且放得下的序列
+
+    Returns:
+        list: 每个打包序列包含的样本序号
+    """
+    bins = []
+    free = []  # (剩余空间, 序列号)，按剩余空间排序
+    for idx in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+        length = min(lengths[idx], pack_length)
+        pos = bisect_left(free, (length, -1))
+        if pos < len(free):
+            remaining, bin_idx = free.pop(pos)
+        else:
+            remaining, bin_idx = pack_length, len(bins)
+            bins.append([])
+        bins[bin_idx].append(idx)
+        remaining -= length
+        if remaining > 0:
+            insort(free, (remaining, bin_idx))
+    return bins
+
+
+def pack_sequences(input_ids, labels, pack_length, pad_token_id):
+    """
+    把样本打包为长度恰好为 pack_length 的序列
+    每条样本的 position_ids 从0开始，segment_ids 标明所属样本（1, 2, ...，补齐部分为0），
+    每条样本第一个token的label置为-100，避免用上一条样本预测下一条样本
+
+    Returns:
+        (列名 -> 每条打包序列的值列表, plan_packing 的结果)
+    """
+    bins = plan_packing([len(ids) for ids in input_ids], pack_length)
+
+    packed = {"input_ids": [], "labels": [], "position_ids": [], "segment_ids": [], "attention_mask": []}
+    for bin_indices in bins:
+        seq_ids, seq_labels, seq_positions, seq_segments = [], [], [], []
+        for segment, idx in enumerate(bin_indices, 1):
+            sample_ids = input_ids[idx][:pack_length]
+            sample_labels = labels[idx][:pack_length]
+            seq_ids.extend(sample_ids)
+            seq_labels.append(-100)
+            seq_labels.extend(sample_labels[1:])
+            seq_positions.extend(range(len(sample_ids)))
+            seq_segments.extend([segment] * len(sample_ids))
+        num_pad = pack_length - len(seq_ids)
+        packed["input_ids"].append(seq_ids + [pad_token_id] * num_pad)
+        packed["labels"].append(seq_labels + [-100] * num_pad)
+        packed["position_ids"].append(seq_positions + [0] * num_pad)
+        packed["segment_ids"].append(seq_segments + [0] * num_pad)
+        packed["attention_mask"].append([1] * len(seq_ids) + [0] * num_pad)
+    return packed, bins
+
+
+class PackedDataCollator:
+    """
+    打包序列的 collator（序列等长，直接堆叠），两种模式见模块说明
+
+    :param block_diagonal: True 时输出四维块对角因果掩码；False 时只输出 position_ids（仅限内置模型的 flash_attention_2）
+    :param dtype: 四维掩码的类型，与模型的计算精度一致，默认 torch.float32
+    """
+
+    def __init__(self, block_diagonal=True, dtype=None):
+        import torch
+
+        self.block_diagonal = block_diagonal
+        self.dtype = dtype if dtype is not None else torch.float32
+
+    def __call__(self, features):
+        import torch
+
+        batch = {key: torch.tensor([f[key] for f in features], dtype=torch.long)
+                 for key in ("input_ids", "labels", "position_ids")}
+        if not self.block_diagonal:
+            return batch
+        segment_ids = torch.tensor([f["segment_ids"] for f in features], dtype=torch.long)
+        length = segment_ids.shape[1]
+        causal = torch.ones(length, length, dtype=torch.bool).tril()
+        same_segment = (segment_ids[:, :, None] == segment_ids[:, None, :]) & (segment_ids[:, :, None] > 0)
+        # 补齐位置只看自己，避免整行都不可见时 softmax 得到 NaN（其 label 为 -100，不影响 loss）
+        padding = torch.eye(length, dtype=torch.bool) & (segment_ids[:, :, None] == 0)
+        batch["attention_mask"] = ((same_segment & causal) | padding)[:, None].to(self.dtype)
+        return batch
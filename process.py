@@ -1,32 +1,194 @@
-from datasets import Dataset
+import os
+import json
+import hashlib
+from datasets import Dataset, load_from_disk
 import pandas as pd
 from transformers import AutoTokenizer, AutoModelForCausalLM, DataCollatorForSeq2Seq, TrainingArguments, Trainer, GenerationConfig
+from arrow2blockjson import iter_instruction_records
+from packing import pack_sequences, PackedDataCollator
 
-df = pd.read_json('huanhuan.json')
-ds = Dataset.from_pandas(df)
-
+DATA_PATH = 'huanhuan.json'
 model_path = '/root/autodl-tmp/deepseek-ai/DeepSeek-Coder-V2-Lite-Instruct'
 
-tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=False, trust_remote_code=True)
+MAX_LENGTH = 384
+
+# 打包：把多条样本装进固定长度的序列，代替逐条截断到 MAX_LENGTH 再按批补齐
+PACKING = True
+PACK_LENGTH = 2048
+
+# 报告“打包前”的补齐比例时假设的每批样本数（DataCollatorForSeq2Seq 按批内最长样本补齐）
+REPORT_BATCH_SIZE = 8
+
+# 提示词模板：prompt 整体 strip 后与 response 分别分词，prompt 部分的 labels 为 -100
+PROMPT_TEMPLATE = "<｜begin▁of▁sentence｜>假设你是皇帝身边的女人--甄嬛。\nUser: {instruction}{input}\nAssistant: "
+RESPONSE_TEMPLATE = "{output}<｜end▁of▁sentence｜>"
+
+# 批内所有 prompt 的公共前缀（系统提示词、arrow2blockjson 的固定 instruction）只分词一次并缓存，
+# 每条只对剩余部分分词；前缀不足 MIN_PREFIX_CHARS 个字符时不拆分，
+# 每个新前缀先用 PREFIX_VERIFY_SAMPLES 条样本校验拆分分词与整体分词结果一致
+MIN_PREFIX_CHARS = 32
+PREFIX_VERIFY_SAMPLES = 8
+
+# ds.map 的进程数与每批样本数
+NUM_PROC = os.cpu_count() or 1
+MAP_BATCH_SIZE = 1000
+
+# 分词结果的磁盘缓存目录，键为 数据文件 + tokenizer + 模板 + 截断长度；输出列变化时递增 CACHE_VERSION
+TOKENIZED_CACHE_DIR = './cache/tokenized'
+CACHE_VERSION = 2
+
+def load_instruction_dataset(path):
+    # arrow2blockjson.py 的列式输出（.parquet/.arrow）直接按列读取并拼接出 input/output，不经过JSON解析
+    if path.endswith(('.parquet', '.arrow')):
+        return Dataset.from_generator(iter_instruction_records, gen_kwargs={'path': path})
+    df = pd.read_json(path, lines=path.endswith('.jsonl'))
+    return Dataset.from_pandas(df)
+
+ds = load_instruction_dataset(DATA_PATH)
+
+# 使用 Rust 实现的 fast tokenizer，批量分词
+tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True, trust_remote_code=True)
 tokenizer.padding_side = 'right'
 
-def process_func(example):
-    MAX_LENGTH = 384
-    input_ids, attention_mask, labels = [], [], []
-    instruction = tokenizer((f"<｜begin▁of▁sentence｜>假设你是皇帝身边的女人--甄嬛。\n"
-                            f"User: {example['instruction']+example['input']}\nAssistant: "
-                            ).strip(), 
-                            add_special_tokens=False)
-    response = tokenizer(f"{example['output']}<｜end▁of▁sentence｜>", add_special_tokens=False)
-    input_ids = instruction["input_ids"] + response["input_ids"] + [tokenizer.pad_token_id]
-    attention_mask = instruction["attention_mask"] + response["attention_mask"] + [1]  # 因为eos token咱们也是要关注的所以 补充为1
-    labels = [-100] * len(instruction["input_ids"]) + response["input_ids"] + [tokenizer.pad_token_id]  
-    if len(input_ids) > MAX_LENGTH:  # 做一个截断
-        input_ids = input_ids[:MAX_LENGTH]
-        attention_mask = attention_mask[:MAX_LENGTH]
-        labels = labels[:MAX_LENGTH]
-    return {
-        "input_ids": input_ids,
-        "attention_mask": attention_mask,
-        "labels": labels
-    }
\ No newline at end of file
+# 前缀 -> token ids；校验不一致的前缀记为 None，之后整体分词
+prefix_ids_cache = {}
+
+def split_constant_prefix(texts):
+    """
+    批内文本的公共前缀，截断到某个空格之前：空格前是非空白字符、空格后也是非空白字符，
+    这是 byte-level BPE 的预分词边界，前缀与剩余部分分开分词不会改变结果
+    """
+    if len(texts) < 2:
+        return ''
+    prefix = os.path.commonprefix(texts)
+
+    def is_boundary(end):
+        if prefix[end - 1].isspace():
+            return False
+        if end + 1 < len(prefix):
+            return not prefix[end + 1].isspace()
+        return all(len(text) > end + 1 and not text[end + 1].isspace() for text in texts)
+
+    end = len(prefix)
+    while True:
+        end = prefix.rfind(' ', 0, end)
+        if end < MIN_PREFIX_CHARS:
+            return ''
+        if is_boundary(end):
+            return prefix[:end]
+
+def tokenize_prompts(prompts):
+    """对一批 prompt 分词，公共前缀的 token ids 从缓存中取出后与剩余部分的 token ids 拼接"""
+    prefix = split_constant_prefix(prompts)
+    if prefix and prefix not in prefix_ids_cache:
+        prefix_ids = tokenizer(prefix, add_special_tokens=False)["input_ids"]
+        samples = prompts[:PREFIX_VERIFY_SAMPLES]
+        full_ids = tokenizer(samples, add_special_tokens=False)["input_ids"]
+        rest_ids = tokenizer([p[len(prefix):] for p in samples], add_special_tokens=False)["input_ids"]
+        consistent = all(full == prefix_ids + rest for full, rest in zip(full_ids, rest_ids))
+        prefix_ids_cache[prefix] = prefix_ids if consistent else None
+    prefix_ids = prefix_ids_cache.get(prefix) if prefix else None
+    if prefix_ids is None:
+        return tokenizer(prompts, add_special_tokens=False)["input_ids"]
+    rest_ids = tokenizer([p[len(prefix):] for p in prompts], add_special_tokens=False)["input_ids"]
+    return [prefix_ids + ids for ids in rest_ids]
+
+def process_func(examples, max_length=MAX_LENGTH):
+    """
+    批量处理（ds.map(batched=True)）：一批样本的 prompt 与 response 各调用一次 tokenizer，prompt 的公共前缀只分词一次
+    num_tokens 为截断前的长度，用于统计截断率
+    """
+    prompts = [PROMPT_TEMPLATE.format(instruction=instruction, input=input_text).strip()
+               for instruction, input_text in zip(examples['instruction'], examples['input'])]
+    responses = [RESPONSE_TEMPLATE.format(output=output) for output in examples['output']]
+    prompt_ids = tokenize_prompts(prompts)
+    response_ids = tokenizer(responses, add_special_tokens=False)["input_ids"]
+
+    batch = {"input_ids": [], "attention_mask": [], "labels": [], "num_tokens": []}
+    for instruction, response in zip(prompt_ids, response_ids):
+        input_ids = instruction + response + [tokenizer.pad_token_id]
+        attention_mask = [1] * len(input_ids)  # 因为eos token咱们也是要关注的所以 补充为1
+        labels = [-100] * len(instruction) + response + [tokenizer.pad_token_id]
+        # 做一个截断
+        batch["input_ids"].append(input_ids[:max_length])
+        batch["attention_mask"].append(attention_mask[:max_length])
+        batch["labels"].append(labels[:max_length])
+        batch["num_tokens"].append(len(input_ids))
+    return batch
+
+def tokenizer_fingerprint(tokenizer):
+    """tokenizer 的内容指纹：fast tokenizer 取完整的 tokenizer.json，否则取名称与词表"""
+    digest = hashlib.sha256(tokenizer.name_or_path.encode())
+    if tokenizer.is_fast:
+        digest.update(tokenizer.backend_tokenizer.to_str().encode())
+    else:
+        digest.update(json.dumps(sorted(tokenizer.get_vocab().items()), ensure_ascii=False).encode())
+    digest.update(json.dumps(tokenizer.all_special_tokens, ensure_ascii=False).encode())
+    return digest.hexdigest()
+
+def tokenized_cache_path(data_path, tokenizer, max_length=MAX_LENGTH):
+    """分词缓存路径：数据文件（路径、大小、修改时间）、tokenizer、模板或截断长度任一变化都会换一个目录"""
+    stat = os.stat(data_path)
+    key = json.dumps({
+        'version': CACHE_VERSION,
+        'data': [os.path.abspath(data_path), stat.st_size, stat.st_mtime_ns],
+        'tokenizer': tokenizer_fingerprint(tokenizer),
+        'prompt_template': PROMPT_TEMPLATE,
+        'response_template': RESPONSE_TEMPLATE,
+        'max_length': max_length,
+    }, ensure_ascii=False, sort_keys=True)
+    return os.path.join(TOKENIZED_CACHE_DIR, hashlib.sha256(key.encode()).hexdigest()[:16])
+
+def tokenize_dataset(ds, data_path=DATA_PATH, num_proc=NUM_PROC, max_length=MAX_LENGTH):
+    """分词整个数据集；已有相同键的缓存时直接从磁盘加载（memory_map），跳过分词"""
+    cache_path = tokenized_cache_path(data_path, tokenizer, max_length)
+    if os.path.exists(cache_path):
+        print(f"从缓存加载分词结果: {cache_path}")
+        return load_from_disk(cache_path)
+    tokenized = ds.map(process_func, batched=True, batch_size=MAP_BATCH_SIZE, fn_kwargs={'max_length': max_length},
+                       num_proc=min(num_proc, max(1, len(ds) // MAP_BATCH_SIZE)),
+                       remove_columns=ds.column_names)
+    # 先写到临时目录再改名，中断时不会留下不完整的缓存
+    tmp_path = f"{cache_path}.tmp{os.getpid()}"
+    tokenized.save_to_disk(tmp_path)
+    os.replace(tmp_path, cache_path)
+    print(f"分词结果已缓存到: {cache_path}")
+    return tokenized
+
+def pack_dataset(tokenized, pack_length=PACK_LENGTH):
+    """
+    把分词后的样本打包为长度恰好为 pack_length 的序列（见 packing.pack_sequences）
+
+    Returns:
+        (打包后的 Dataset, plan_packing 的结果)
+    """
+    packed, bins = pack_sequences(tokenized['input_ids'], tokenized['labels'], pack_length, tokenizer.pad_token_id)
+    return Dataset.from_dict(packed), bins
+
+def padding_report(num_tokens, max_length=MAX_LENGTH, batch_size=REPORT_BATCH_SIZE, bins=None, pack_length=PACK_LENGTH):
+    """
+    打印补齐比例与截断率
+    打包前：每条截断到 max_length，按数据集顺序每 batch_size 条补齐到批内最长
+    打包后：每条截断到 pack_length，打包序列补齐到 pack_length
+    """
+    def truncation(limit):
+        truncated = sum(1 for n in num_tokens if n > limit)
+        lost = sum(n - limit for n in num_tokens if n > limit)
+        return truncated / max(len(num_tokens), 1), lost / max(sum(num_tokens), 1)
+
+    kept = [min(n, max_length) for n in num_tokens]
+    padded = sum(max(kept[i:i + batch_size]) * len(kept[i:i + batch_size]) for i in range(0, len(kept), batch_size))
+    sample_rate, token_rate = truncation(max_length)
+    print(f"打包前: 补齐比例 {1 - sum(kept) / max(padded, 1):.1%}（batch_size={batch_size}），"
+          f"截断样本 {sample_rate:.1%}，丢弃token {token_rate:.1%}（MAX_LENGTH={max_length}）")
+    if bins is not None:
+        kept = sum(min(n, pack_length) for n in num_tokens)
+        sample_rate, token_rate = truncation(pack_length)
+        print(f"打包后: {len(num_tokens)} 条样本 -> {len(bins)} 条序列，补齐比例 {1 - kept / max(len(bins) * pack_length, 1):.1%}，"
+              f"截断样本 {sample_rate:.1%}，丢弃token {token_rate:.1%}（PACK_LENGTH={pack_length}）")
+
+tokenized_id = tokenize_dataset(ds, max_length=PACK_LENGTH if PACKING else MAX_LENGTH)
+packed_id = None
+if PACKING:
+    packed_id, packing_bins = pack_dataset(tokenized_id, PACK_LENGTH)
+    padding_report(tokenized_id['num_tokens'], MAX_LENGTH, REPORT_BATCH_SIZE, packing_bins, PACK_LENGTH)
@@ -4,22 +4,111 @@ from peft import PeftModel
 
 model_path = '/root/autodl-tmp/deepseek-ai/DeepSeek-Coder-V2-Lite-Instruct'
 lora_path = './output/deepseek_coder_v2'
+# merge_lora.py 导出的合并权重（单个 model.safetensors）
+merged_path = './output/deepseek_coder_v2_merged'
 
-# 加载tokenizer
-tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+SYSTEM_PROMPT = "假设你是皇帝身边的女人--甄嬛。"
+MAX_NEW_TOKENS = 512
 
-# 加载模型
-model = AutoModelForCausalLM.from_pretrained(model_path, device_map="auto",torch_dtype=torch.bfloat16, trust_remote_code=True).eval()
+def load_model(model_path=model_path, lora_path=lora_path):
+    """加载tokenizer、模型与lora权重（lora_path 为 None 时只加载基座模型）"""
+    # 加载tokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
 
-# 加载lora权重
-model = PeftModel.from_pretrained(model, model_id=lora_path)
+    # 加载模型
+    model = AutoModelForCausalLM.from_pretrained(model_path, device_map="auto",torch_dtype=torch.bfloat16, trust_remote_code=True).eval()
 
-messages=[
-    {'role': 'sysrem', 'content': "假设你是皇帝身边的女人--甄嬛。"},
-    { 'role': 'user', 'content': "你好"}
-]
+    # 加载lora权重
+    if lora_path:
+        model = PeftModel.from_pretrained(model, model_id=lora_path)
+    return model, tokenizer
 
-inputs = tokenizer.apply_chat_template(messages, add_generation_prompt=True, return_tensors="pt").to(model.device)
+def load_merged_model(merged_path=merged_path):
+    """
+    加载合并了lora的模型：没有 PeftModel 包装，前向不再额外计算lora分支
+    low_cpu_mem_usage 下先在 meta 设备上构建模型，再把 memory_map 的 safetensors 直接赋给参数
+    """
+    tokenizer = AutoTokenizer.from_pretrained(merged_path, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_pretrained(merged_path, device_map="auto", torch_dtype=torch.bfloat16,
+                                                 trust_remote_code=True, low_cpu_mem_usage=True).eval()
+    return model, tokenizer
 
-outputs = model.generate(inputs, max_new_tokens=512, do_sample=False, top_k=50, top_p=0.95, num_return_sequences=1, eos_token_id=tokenizer.eos_token_id)
-print(tokenizer.decode(outputs[0][len(inputs[0]):], skip_special_tokens=True))
\ No newline at end of file
+def encode_messages(tokenizer, messages):
+    """对话消息 -> prompt 的 token ids（没有 chat template 的 tokenizer 直接拼接各条消息的内容）"""
+    if getattr(tokenizer, 'chat_template', None):
+        return tokenizer.apply_chat_template(messages, add_generation_prompt=True)
+    return tokenizer.encode('\n'.join(m['content'] for m in messages), add_special_tokens=False)
+
+def build_messages(prompt, system_prompt=SYSTEM_PROMPT):
+    return [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': prompt}
+    ]
+
+def payload_messages(payload):
+    """请求 -> 对话消息：messages 原样使用；prompt 或 instruction + input（与训练数据相同的拼接方式）作为用户消息"""
+    if payload.get('messages'):
+        return payload['messages']
+    if 'prompt' in payload:
+        return build_messages(payload['prompt'])
+    return build_messages(payload['instruction'] + payload.get('input', ''))
+
+def generate_batch(model, tokenizer, prompt_ids, max_new_tokens=MAX_NEW_TOKENS, prefix_cache=None, assisted=None,
+                   **generate_kwargs):
+    """
+    一批 prompt 左侧补齐后一次 generate（贪心解码，使用 KV cache）
+
+    Args:
+        prompt_ids: 每条 prompt 的 token ids
+        max_new_tokens: 每条最多生成的 token 数，可以是整数或与 prompt_ids 等长的列表
+        prefix_cache: prefix_cache.PrefixKVCache，批内 prompt 的公共前缀复用缓存的 KV，
+            每条排成 [前缀][补齐][剩余部分]（position_ids 由 attention_mask 累加得到，中间的补齐不影响位置）
+        assisted: assisted_decoding.AssistedDecoder，辅助解码（只支持每次一条，多条时逐条生成；不与 prefix_cache 同时使用）
+
+    Returns:
+        list: 每条新生成的 token ids（截断到 eos 之前）
+    """
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    if isinstance(max_new_tokens, int):
+        max_new_tokens = [max_new_tokens] * len(prompt_ids)
+    if assisted is not None:
+        if len(prompt_ids) > 1:
+            return [generate_batch(model, tokenizer, [ids], [limit], assisted=assisted, **generate_kwargs)[0]
+                    for ids, limit in zip(prompt_ids, max_new_tokens)]
+        generate_kwargs.update(assisted.generate_kwargs())
+        prefix_cache = None
+    prefix_ids = []
+    if prefix_cache is not None:
+        prefix_ids, past_key_values = prefix_cache.lookup(model, prompt_ids)
+        if past_key_values is not None:
+            generate_kwargs['past_key_values'] = past_key_values
+    suffixes = [list(ids[len(prefix_ids):]) for ids in prompt_ids]
+    suffix_len = max(len(ids) for ids in suffixes)
+    max_len = len(prefix_ids) + suffix_len
+    input_ids = torch.tensor([prefix_ids + [pad_token_id] * (suffix_len - len(ids)) + ids for ids in suffixes],
+                             device=model.device)
+    attention_mask = torch.tensor([[1] * len(prefix_ids) + [0] * (suffix_len - len(ids)) + [1] * len(ids)
+                                   for ids in suffixes], device=model.device)
+    if assisted is not None:
+        assisted.begin()
+    with torch.inference_mode():
+        outputs = model.generate(input_ids=input_ids, attention_mask=attention_mask,
+                                 max_new_tokens=max(max_new_tokens), do_sample=False, use_cache=True,
+                                 pad_token_id=pad_token_id, eos_token_id=tokenizer.eos_token_id, **generate_kwargs)
+    if assisted is not None:
+        assisted.record(max_len, outputs.shape[1] - max_len)
+
+    results = []
+    for row, limit in zip(outputs[:, max_len:].tolist(), max_new_tokens):
+        row = row[:limit]
+        if tokenizer.eos_token_id in row:
+            row = row[:row.index(tokenizer.eos_token_id)]
+        results.append(row)
+    return results
+
+if __name__ == '__main__':
+    model, tokenizer = load_model()
+
+    inputs = encode_messages(tokenizer, build_messages("你好"))
+    outputs = generate_batch(model, tokenizer, [inputs])
+    print(tokenizer.decode(outputs[0], skip_special_tokens=True))
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+arrow2blockjson 的分片、续跑与列式输出测试（使用临时目录中生成的小数据集）
+"""
+import os
+import json
+import pytest
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import arrow2blockjson
+from arrow2blockjson import (main, plan_shard_tasks, load_resume_state, iter_instruction_records,
+                             checkpoint_path, encode_json_line, format_instruction_record, MANIFEST_NAME)
+
+NUM_BATCHES = 12
+BATCH_ROWS = 24
+NUM_RECORDS = NUM_BATCHES * BATCH_ROWS
+SEED = 1
+WRITE_BATCH_SIZE = 16
+
+
+def make_dataset(root):
+    """生成 datasets/data.arrow（IPC stream，NUM_BATCHES 个 batch）与对应的 split_lines 结果"""
+    datasets_dir = os.path.join(root, 'datasets')
+    blocks_dir = os.path.join(root, 'blocks')
+    os.makedirs(datasets_dir)
+    os.makedirs(blocks_dir)
+    schema = pa.schema([('code', pa.string()), ('name', pa.string()), ('asm', pa.string())])
+    results = []
+    with pa.OSFile(os.path.join(datasets_dir, 'data.arrow'), 'wb') as sink, ipc.new_stream(sink, schema) as writer:
+        for batch_idx in range(NUM_BATCHES):
+            names = [f'f{batch_idx * BATCH_ROWS + i}' for i in range(BATCH_ROWS)]
+            codes = ['\n'.join(f'line {line} of {name}' for line in range(10)) for name in names]
+            writer.write_batch(pa.record_batch([pa.array(codes), pa.array(names),
+                                                pa.array([f'asm of {name}' for name in names])], schema=schema))
+            results.extend({'name': name, 'split_lines': [1, 3, 6, 8]} for name in names)
+    with open(os.path.join(blocks_dir, 'data_all_blocks.json'), 'w', encoding='utf-8') as f:
+        json.dump(results, f)
+    return datasets_dir, blocks_dir
+
+
+def run(datasets_dir, blocks_dir, output_dir, batches_per_task=4, resume=False, workers=1, output_format='jsonl'):
+    main(datasets_dir, blocks_dir, output_dir, workers=workers, batches_per_task=batches_per_task, seed=SEED,
+         output_format=output_format, write_batch_size=WRITE_BATCH_SIZE, resume=resume)
+    return os.path.join(output_dir, f'data_example{arrow2blockjson.OUTPUT_EXTS[output_format]}')
+
+
+def read_lines(path):
+    with open(path, 'rb') as f:
+        return f.read().splitlines()
+
+
+def read_manifest(output_dir):
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    datasets_dir, blocks_dir = make_dataset(str(tmp_path))
+    return str(tmp_path), datasets_dir, blocks_dir
+
+
+@pytest.fixture
+def expected(dataset):
+    """一次不中断运行的输出（batches_per_task -> 输出行）"""
+    root, datasets_dir, blocks_dir = dataset
+    cache = {}
+
+    def get(batches_per_task=4):
+        if batches_per_task not in cache:
+            output_dir = os.path.join(root, f'expected{batches_per_task}')
+            cache[batches_per_task] = read_lines(run(datasets_dir, blocks_dir, output_dir, batches_per_task))
+        return cache[batches_per_task]
+    return get
+
+
+def crash_after(monkeypatch, num_batches, start_batch):
+    """让从 start_batch 开始的任务读取 num_batches 个 batch 后像进程被杀一样中断（不经过任务内的异常处理）"""
+    iter_arrow_batches = arrow2blockjson.iter_arrow_batches
+
+    def crashing(arrow_path, *args, **kwargs):
+        for i, batch in enumerate(iter_arrow_batches(arrow_path, *args, **kwargs)):
+            if kwargs.get('start_batch') == start_batch and i == num_batches:
+                raise KeyboardInterrupt
+            yield batch
+    monkeypatch.setattr(arrow2blockjson, 'iter_arrow_batches', crashing)
+
+
+def test_output_is_deterministic(dataset, expected):
+    lines = expected()
+    assert len(lines) == NUM_RECORDS
+    assert len(set(lines)) == NUM_RECORDS
+
+
+def test_resume_after_crash(dataset, expected, monkeypatch):
+    root, datasets_dir, blocks_dir = dataset
+    output_dir = os.path.join(root, 'out')
+    crash_after(monkeypatch, 3, start_batch=4)
+    with pytest.raises(KeyboardInterrupt):
+        run(datasets_dir, blocks_dir, output_dir)
+    monkeypatch.undo()
+
+    # 第2个任务中断在检查点之后：分片文件与检查点都在，检查点未完成
+    task = plan_shard_tasks(os.path.join(datasets_dir, 'data.arrow'), None, output_dir, 4)[1]
+    with open(checkpoint_path(task['output_file']), 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    assert not state['done'] and 4 < state['next_batch'] < 8
+
+    assert read_lines(run(datasets_dir, blocks_dir, output_dir, resume=True)) == expected()
+    assert read_manifest(output_dir)['shards']['data']['status'] == 'done'
+    assert not [f for f in os.listdir(output_dir) if '.part' in f]
+
+
+def test_failed_part_is_not_merged(dataset, expected, monkeypatch):
+    root, datasets_dir, blocks_dir = dataset
+    output_dir = os.path.join(root, 'out')
+    write_instruction_records = arrow2blockjson.write_instruction_records
+
+    def failing(*args, **kwargs):
+        if kwargs.get('start_batch') == 4:
+            raise RuntimeError('injected failure')
+        return write_instruction_records(*args, **kwargs)
+    monkeypatch.setattr(arrow2blockjson, 'write_instruction_records', failing)
+    output_file = run(datasets_dir, blocks_dir, output_dir)
+    monkeypatch.undo()
+
+    shard = read_manifest(output_dir)['shards']['data']
+    assert shard['status'] == 'failed'
+    assert shard['failed_parts'] == [1]
+    assert not os.path.exists(output_file)
+
+    # 续跑只重做失败的分片，结果与不中断运行一致
+    assert read_lines(run(datasets_dir, blocks_dir, output_dir, resume=True)) == expected()
+    assert read_manifest(output_dir)['shards']['data']['status'] == 'done'
+
+
+def test_resume_with_changed_batches_per_task(dataset, expected, monkeypatch):
+    root, datasets_dir, blocks_dir = dataset
+    output_dir = os.path.join(root, 'out')
+    crash_after(monkeypatch, 3, start_batch=8)
+    with pytest.raises(KeyboardInterrupt):
+        run(datasets_dir, blocks_dir, output_dir, batches_per_task=4)
+    monkeypatch.undo()
+
+    lines = read_lines(run(datasets_dir, blocks_dir, output_dir, batches_per_task=2, resume=True))
+    assert len(lines) == NUM_RECORDS
+    assert lines == expected(2)
+
+
+def test_checkpoint_from_other_config_is_rejected(dataset, monkeypatch):
+    root, datasets_dir, blocks_dir = dataset
+    output_dir = os.path.join(root, 'out')
+    crash_after(monkeypatch, 1, start_batch=0)
+    with pytest.raises(KeyboardInterrupt):
+        run(datasets_dir, blocks_dir, output_dir, batches_per_task=4)
+    monkeypatch.undo()
+
+    arrow_file = os.path.join(datasets_dir, 'data.arrow')
+    task = plan_shard_tasks(arrow_file, None, output_dir, 4)[0]
+    assert load_resume_state(task, SEED)[0] == 'partial'
+    assert load_resume_state(task, SEED + 1) == (None, None)
+    assert load_resume_state(dict(task, output_format='parquet'), SEED) == (None, None)
+    # 起始batch相同但切分方式不同
+    assert load_resume_state(plan_shard_tasks(arrow_file, None, output_dir, 2)[0], SEED) == (None, None)
+
+
+def test_workers_do_not_change_output(dataset, expected):
+    root, datasets_dir, blocks_dir = dataset
+    assert read_lines(run(datasets_dir, blocks_dir, os.path.join(root, 'out'), workers=2)) == expected()
+
+
+@pytest.mark.parametrize('output_format', ['parquet', 'arrow'])
+def test_columnar_round_trip(dataset, expected, output_format):
+    root, datasets_dir, blocks_dir = dataset
+    output_file = run(datasets_dir, blocks_dir, os.path.join(root, 'out'), output_format=output_format)
+    assert list(iter_instruction_records(output_file)) == [json.loads(line) for line in expected()]
+
+
+def test_json_encoders_write_same_bytes(monkeypatch):
+    pytest.importorskip('orjson')
+    records = [
+        format_instruction_record([1, 3, 6], 'mov eax, 1\n\tret', 'int f() {\n<MASK>\n}', ['  return 0;', '']),
+        {'s': '中文 \t\n\r\b\f\x00\x1f\x7f\u2028\u2029 "q" \\ / \U0001f600 é', 'n': None, 'b': True,
+         'l': [], 'd': {}, 'i': -12},
+    ]
+    with_orjson = [encode_json_line(record) for record in records]
+    monkeypatch.setattr(arrow2blockjson, 'orjson', None)
+    assert [encode_json_line(record) for record in records] == with_orjson
+    # orjson 不接受孤立的代理字符，两种环境都由标准库转义后写出
+    assert encode_json_line({'s': '\ud800'}) == b'{"s":"\\ud800"}\n'
+
+
+def test_output_does_not_depend_on_orjson(dataset, expected, monkeypatch):
+    pytest.importorskip('orjson')
+    root, datasets_dir, blocks_dir = dataset
+    with_orjson = expected()
+    monkeypatch.setattr(arrow2blockjson, 'orjson', None)
+    assert read_lines(run(datasets_dir, blocks_dir, os.path.join(root, 'out'))) == with_orjson
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+样本打包与打包序列 collator 的测试（collator 的用例需要 torch）
+"""
+import random
+import pytest
+from packing import plan_packing, pack_sequences, PackedDataCollator
+
+PAD_TOKEN_ID = 0
+
+
+def make_samples(num_samples=40, max_len=300, seed=0):
+    rng = random.Random(seed)
+    input_ids = [[rng.randint(1, 1000) for _ in range(rng.randint(1, max_len))] for _ in range(num_samples)]
+    labels = [[-100] * (len(ids) // 2) + ids[len(ids) // 2:] for ids in input_ids]
+    return input_ids, labels
+
+
+def test_plan_packing_places_every_sample_once():
+    lengths = [len(ids) for ids in make_samples()[0]] + [5000]
+    bins = plan_packing(lengths, 512)
+    assert sorted(idx for bin_indices in bins for idx in bin_indices) == list(range(len(lengths)))
+    for bin_indices in bins:
+        assert sum(min(lengths[idx], 512) for idx in bin_indices) <= 512
+
+
+def test_pack_sequences_keeps_samples_separate():
+    input_ids, labels = make_samples()
+    pack_length = 512
+    packed, bins = pack_sequences(input_ids, labels, pack_length, PAD_TOKEN_ID)
+    assert len(packed['input_ids']) == len(bins)
+    for row, bin_indices in enumerate(bins):
+        for key in packed:
+            assert len(packed[key][row]) == pack_length
+        offset = 0
+        for segment, idx in enumerate(bin_indices, 1):
+            n = len(input_ids[idx])
+            span = slice(offset, offset + n)
+            assert packed['input_ids'][row][span] == input_ids[idx]
+            assert packed['position_ids'][row][span] == list(range(n))
+            assert packed['segment_ids'][row][span] == [segment] * n
+            # 每条样本的第一个token不由上一条样本预测
+            assert packed['labels'][row][span] == [-100] + labels[idx][1:]
+            offset += n
+        assert packed['input_ids'][row][offset:] == [PAD_TOKEN_ID] * (pack_length - offset)
+        assert packed['labels'][row][offset:] == [-100] * (pack_length - offset)
+        assert packed['segment_ids'][row][offset:] == [0] * (pack_length - offset)
+
+
+def packed_features():
+    packed, _ = pack_sequences([[1, 2, 3], [4, 5], [6, 7, 8, 9]], [[1, 2, 3], [4, 5], [6, 7, 8, 9]], 8, PAD_TOKEN_ID)
+    return [{key: values[row] for key, values in packed.items()} for row in range(len(packed['input_ids']))]
+
+
+def test_collator_block_diagonal_mask():
+    torch = pytest.importorskip('torch')
+    features = packed_features()
+    batch = PackedDataCollator()(features)
+    mask = batch['attention_mask']
+    length = len(features[0]['input_ids'])
+    assert mask.shape == (len(features), 1, length, length)
+    assert mask.dtype == torch.float32
+    for row, feature in enumerate(features):
+        segments = feature['segment_ids']
+        for i in range(length):
+            for j in range(length):
+                if segments[i] == 0:
+                    allowed = i == j
+                else:
+                    allowed = j <= i and segments[j] == segments[i]
+                assert mask[row, 0, i, j].item() == float(allowed), (row, i, j)
+    for key in ('input_ids', 'labels', 'position_ids'):
+        assert batch[key].tolist() == [f[key] for f in features]
+
+
+def test_collator_position_ids_only():
+    pytest.importorskip('torch')
+    batch = PackedDataCollator(block_diagonal=False)(packed_features())
+    # 没有 attention_mask 时 flash_attention_2 才会按 position_ids 切分样本
+    assert 'attention_mask' not in batch
+    assert set(batch) == {'input_ids', 'labels', 'position_ids'}
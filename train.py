@@ -0,0 +1,70 @@
+import torch
+from transformers import AutoModelForCausalLM, DataCollatorForSeq2Seq, TrainingArguments, Trainer
+from peft import LoraConfig, TaskType, get_peft_model
+from process import (model_path, tokenizer, tokenized_id, MAX_LENGTH, PACKING, packed_id, PackedDataCollator)
+from length_sampler import LengthBucketTrainer
+
+OUTPUT_DIR = './output/deepseek_coder_v2'
+
+# 不打包时按长度分桶：每批最多 BATCH_SIZE 条，且补齐后不超过 MAX_BATCH_TOKENS 个 token
+# （原来是 batch_size=1 + 梯度累积8，分桶后批内补齐很少，可以直接用更大的批）
+BATCH_SIZE = 8
+GRADIENT_ACCUMULATION_STEPS = 1
+MAX_BATCH_TOKENS = BATCH_SIZE * MAX_LENGTH
+
+model = AutoModelForCausalLM.from_pretrained(model_path, trust_remote_code=True, torch_dtype=torch.float32, device_map="auto")
+model.enable_input_require_grads() # 开启梯度检查点时，要执行该方法
+
+config = LoraConfig(
+    task_type=TaskType.CAUSAL_LM,
+    target_modules=["q_proj", "kv_a_proj_with_mqa", "kv_b_proj", "o_proj", 'gate_proj', 'up_proj', 'down_proj'],  # 现存问题只微调部分演示即可
+    inference_mode=False, # 训练模式
+    r=8, # Lora 秩
+    lora_alpha=32, # Lora alaph，具体作用参见 Lora 原理
+    lora_dropout=0.1# Dropout 比例
+)
+model = get_peft_model(model, config)
+model.print_trainable_parameters()
+
+if PACKING:
+    # 打包后的序列等长，不需要分桶；每条序列已包含多条样本
+    args = TrainingArguments(
+        output_dir=OUTPUT_DIR,
+        per_device_train_batch_size=1,
+        gradient_accumulation_steps=8,
+        logging_steps=10,
+        num_train_epochs=2,
+        save_steps=100,
+        learning_rate=1e-5,
+        save_on_each_node=True,
+        gradient_checkpointing=True,
+        remove_unused_columns=False,  # segment_ids 由 collator 使用
+    )
+    trainer = Trainer(
+        model=model,
+        args=args,
+        train_dataset=packed_id,
+        # DeepSeek 的 remote code 不按 position_ids 区分样本，需要块对角掩码才能让同一序列中的样本互不可见
+        data_collator=PackedDataCollator(block_diagonal=True),
+    )
+else:
+    args = TrainingArguments(
+        output_dir=OUTPUT_DIR,
+        per_device_train_batch_size=BATCH_SIZE,
+        gradient_accumulation_steps=GRADIENT_ACCUMULATION_STEPS,
+        logging_steps=10,
+        num_train_epochs=2,
+        save_steps=100,
+        learning_rate=1e-5,
+        save_on_each_node=True,
+        gradient_checkpointing=True,
+    )
+    trainer = LengthBucketTrainer(
+        model=model,
+        args=args,
+        train_dataset=tokenized_id,
+        data_collator=DataCollatorForSeq2Seq(tokenizer=tokenizer, padding=True),
+        max_tokens=MAX_BATCH_TOKENS,
+    )
+
+trainer.train()
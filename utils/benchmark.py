@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+split_lines 提取的性能测试
+用法：python benchmark.py [jsonl路径] [--repeat N]
+"""
+import json
+import time
+import argparse
+from cpp_cfg_extractor_v2 import CppCfgExtractorV2, parser
+
+# 极短函数，用于衡量每个函数的固定开销
+TINY_FUNCTION = {"name": "tiny", "code": "int f()\n{\n    return 0;\n}"}
+
+def load_records(jsonl_path):
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _time_per_function(func, records):
+    start = time.perf_counter()
+    func(records)
+    return (time.perf_counter() - start) / len(records) * 1e6
+
+def bench_extractor_overhead(records):
+    """对比：每条记录新建提取器 / 复用同一个提取器 / analyze_many 批量接口（单位：微秒/函数）"""
+    def per_record(rs):
+        for r in rs:
+            CppCfgExtractorV2().analyze_cpp_code(r['code'], r['name'])
+
+    shared = CppCfgExtractorV2()
+
+    def reused(rs):
+        for r in rs:
+            shared.analyze_cpp_code(r['code'], r['name'])
+
+    def batched(rs):
+        shared.analyze_many(rs)
+
+    for label, rs in (('数据集函数', records), ('极短函数', [TINY_FUNCTION] * len(records))):
+        print(f"[extractor overhead] {label} x{len(rs)}")
+        for mode, func in (('每条新建', per_record), ('复用', reused), ('analyze_many', batched)):
+            print(f"  {mode:<14}{_time_per_function(func, rs):8.1f} us/函数")
+
+def _function_bodies(tree):
+    cursor = tree.walk()
+    cursor.goto_first_child()
+    while True:
+        if cursor.node.type == 'function_definition' and cursor.goto_first_child():
+            while True:
+                if cursor.node.type == 'compound_statement':
+                    yield cursor
+                if not cursor.goto_next_sibling():
+                    break
+            cursor.goto_parent()
+        if not cursor.goto_next_sibling():
+            break
+
+def bench_traversal(records, depth=2000):
+    """分别统计解析与 TreeCursor 遍历的耗时，并用深度嵌套的函数验证不会触发递归限制"""
+    sources = [bytes(r['code'], 'utf8') for r in records]
+    start = time.perf_counter()
+    trees = [parser.parse(src) for src in sources]
+    parse_us = (time.perf_counter() - start) / len(trees) * 1e6
+
+    start = time.perf_counter()
+    for tree in trees:
+        blocks = []
+        for cursor in _function_bodies(tree):
+            CppCfgExtractorV2._walk_function_body(cursor, blocks)
+    walk_us = (time.perf_counter() - start) / len(trees) * 1e6
+
+    print(f"[traversal] x{len(trees)}")
+    print(f"  解析          {parse_us:8.1f} us/函数")
+    print(f"  遍历          {walk_us:8.1f} us/函数")
+
+    lines = ['int deep(int x)', '{']
+    lines += ['if (x > %d) {' % i for i in range(depth)]
+    lines += ['x = 0;'] + ['}'] * depth + ['return x;', '}']
+    result = CppCfgExtractorV2().analyze_c_code('\n'.join(lines), 'deep')
+    status = result.get('error') or f"{len(result['split_lines'])} 个分块"
+    print(f"  嵌套{depth}层     {status}")
+
+def bench_engines(records):
+    """cursor 引擎与 query 参考引擎的一致性检查和吞吐量对比"""
+    cursor_extractor = CppCfgExtractorV2(engine='cursor')
+    query_extractor = CppCfgExtractorV2(engine='query')
+
+    mismatches = []
+    for record in records:
+        expected = cursor_extractor.analyze_cpp_code(record['code'], record['name'])
+        actual = query_extractor.analyze_cpp_code(record['code'], record['name'])
+        if expected != actual:
+            mismatches.append((record['name'], expected, actual))
+
+    print(f"[engines] x{len(records)}")
+    print(f"  不一致        {len(mismatches)} 条")
+    for name, expected, actual in mismatches[:5]:
+        print(f"    {name}: cursor={expected.get('split_lines')} query={actual.get('split_lines')}")
+    for engine, extractor in (('cursor', cursor_extractor), ('query', query_extractor)):
+        start = time.perf_counter()
+        extractor.analyze_many(records)
+        elapsed = time.perf_counter() - start
+        print(f"  {engine:<14}{len(records) / elapsed:8.0f} 函数/秒")
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='split_lines 提取性能测试')
+    arg_parser.add_argument('jsonl', nargs='?', default='view.jsonl')
+    arg_parser.add_argument('--repeat', type=int, default=200, help='数据集重复次数')
+    args = arg_parser.parse_args()
+
+    records = load_records(args.jsonl) * args.repeat
+    bench_extractor_overhead(records)
+    bench_traversal(records)
+    bench_engines(records)
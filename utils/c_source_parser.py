@@ -0,0 +1,219 @@
+"""
+pycparser 的内存解析入口：直接从字符串解析C代码，不写临时文件、不为每个函数启动 cpp
+
+做法：
+1. 代码中 #include 引入的 fake_libc 头文件只在第一次遇到时交给 cpp 预处理并解析一次，
+   得到的 typedef 名与宏定义按 include 集合缓存在进程内，并 pickle 到磁盘
+   （以 fake_libc_include 目录内容的哈希为键，头文件变化后自动失效）
+2. 函数体本身在 Python 中完成 cpp 的必要工作：去注释、删 #include、展开对象宏，
+   行号保持不变；解析时把 typedef 名预置到 CParser 的作用域中，只解析函数体，
+   因此返回的 FileAST 不含头文件中的声明，graph_gen.Graph 也只需处理函数体
+3. 代码中出现条件编译/宏定义、函数宏、续行符等无法在 Python 中可靠处理的情况时，
+   退回到通过管道调用一次 cpp（仍然不落盘，可安全并行）
+"""
+import os
+import re
+import pickle
+import hashlib
+import tempfile
+import subprocess
+from functools import lru_cache
+from typing import Dict, FrozenSet, Tuple
+import pycparser
+from pycparser import c_parser, c_ast
+
+CPP_PATH = '/usr/bin/cpp'
+FAKE_LIBC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_libc_include')
+CPP_ARGS = ['-I', FAKE_LIBC_DIR]
+
+# 解析后的 prelude 的磁盘缓存目录
+PRELUDE_CACHE_DIR = os.environ.get(
+    'C_PRELUDE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'prelude')
+)
+
+# 预处理指令行；include 与 pragma 之外的指令都需要真正的 cpp
+_DIRECTIVE_LINE = re.compile(r'^[ \t]*#[ \t]*(\w*).*$', re.M)
+
+# 字符串/字符字面量、注释、预处理数、标识符
+_TOKEN = re.compile(r'''
+    "(?:\\.|[^"\\\n])*"
+  | '(?:\\.|[^'\\\n])*'
+  | /\*.*?\*/
+  | //[^\n]*
+  | \.?\d(?:[eEpP][+-]|[\w.])*
+  | [A-Za-z_]\w*
+''', re.S | re.X)
+
+# -dM 输出中的宏定义：#define NAME body / #define NAME(args) body
+_DEFINE_LINE = re.compile(r'^#define ([A-Za-z_]\w*)(\(.*?\))? ?(.*)$')
+
+# cpp 动态计算的宏，不出现在 -dM 的输出中
+_DYNAMIC_MACROS = frozenset({
+    '__LINE__', '__FILE__', '__COUNTER__', '__DATE__', '__TIME__',
+    '__TIMESTAMP__', '__INCLUDE_LEVEL__', '__BASE_FILE__'
+})
+
+_parser = None
+
+
+class _NeedsCpp(Exception):
+    """代码需要交给真正的 cpp 预处理"""
+
+
+class SeededCParser(c_parser.CParser):
+    """可以预置 typedef 名的 CParser（基于 pycparser 2.x 的 CParser.parse 实现）"""
+
+    def parse(self, text, filename='', debug=False, typedef_names=()):
+        self.clex.filename = filename
+        self.clex.reset_lineno()
+        # 作用域中 True 表示该名字是类型名
+        self._scope_stack = [dict.fromkeys(typedef_names, True)]
+        self._last_yielded_token = None
+        return self.cparser.parse(
+                input=text,
+                lexer=self.clex,
+                debug=debug)
+
+
+def get_parser() -> SeededCParser:
+    """进程内共享的 CParser（构造时需要加载语法表，代价较高）"""
+    global _parser
+    if _parser is None:
+        _parser = SeededCParser()
+    return _parser
+
+
+def run_cpp(source: str, extra_args=()) -> str:
+    """通过管道调用 cpp 预处理字符串，不写临时文件"""
+    proc = subprocess.run(
+        [CPP_PATH, *extra_args, *CPP_ARGS, '-'],
+        input=source, capture_output=True, text=True, encoding='utf-8'
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"cpp failed: {proc.stderr.strip()}")
+    return proc.stdout
+
+
+@lru_cache(maxsize=None)
+def header_dir_hash() -> str:
+    """fake_libc_include 目录内容（相对路径与文件内容）、cpp 路径与 pycparser 版本的哈希"""
+    digest = hashlib.sha256()
+    digest.update(f'{CPP_PATH}\0{pycparser.__version__}\0'.encode())
+    for root, dirs, files in os.walk(FAKE_LIBC_DIR):
+        dirs.sort()
+        for file in sorted(files):
+            path = os.path.join(root, file)
+            digest.update(os.path.relpath(path, FAKE_LIBC_DIR).encode() + b'\0')
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _build_prelude(include_lines: Tuple[str, ...]) -> Tuple[FrozenSet[str], Dict[str, str], FrozenSet[str]]:
+    source = '\n'.join(include_lines) + '\n'
+
+    typedef_names = frozenset()
+    if include_lines:
+        prelude_ast = get_parser().parse(run_cpp(source), '<prelude>')
+        typedef_names = frozenset(ext.name for ext in prelude_ast.ext if isinstance(ext, c_ast.Typedef))
+
+    object_macros = {}
+    cpp_only_macros = set(_DYNAMIC_MACROS)
+    for line in run_cpp(source, ['-dM']).splitlines():
+        match = _DEFINE_LINE.match(line)
+        if match is None:
+            continue
+        name, params, body = match.groups()
+        if params is not None or '#' in body:
+            cpp_only_macros.add(name)
+        else:
+            object_macros[name] = body
+    return typedef_names, object_macros, frozenset(cpp_only_macros)
+
+
+@lru_cache(maxsize=64)
+def load_prelude(include_lines: Tuple[str, ...]) -> Tuple[FrozenSet[str], Dict[str, str], FrozenSet[str]]:
+    """
+    预处理并解析一组 #include 行，同一组在进程内只做一次，跨进程/跨运行通过磁盘缓存复用
+
+    :param include_lines: 代码中的 #include 行（按出现顺序）
+    :return: (头文件中的 typedef 名, 对象宏 name->body, 只能由 cpp 处理的宏名)
+    """
+    key = hashlib.sha256('\n'.join((header_dir_hash(),) + include_lines).encode()).hexdigest()
+    cache_path = os.path.join(PRELUDE_CACHE_DIR, f'{key}.pkl')
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+
+    prelude = _build_prelude(include_lines)
+    try:
+        os.makedirs(PRELUDE_CACHE_DIR, exist_ok=True)
+        # 先写临时文件再替换，多个进程同时写入也不会读到半个文件
+        fd, tmp_path = tempfile.mkstemp(dir=PRELUDE_CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(prelude, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return prelude
+
+
+def _expand(text: str, object_macros: Dict[str, str], cpp_only_macros: FrozenSet[str], active=frozenset()) -> str:
+    """去注释并展开对象宏（注释替换为空格，保留其中的换行以维持行号）"""
+    def replace(match):
+        token = match.group(0)
+        first = token[0]
+        if first == '"' or first == "'" or first == '.' or first.isdigit():
+            return token
+        if first == '/':
+            return ' ' + '\n' * token.count('\n')
+        if token in cpp_only_macros:
+            raise _NeedsCpp(token)
+        if token in object_macros and token not in active:
+            return _expand(object_macros[token], object_macros, cpp_only_macros, active | {token})
+        return token
+    return _TOKEN.sub(replace, text)
+
+
+def preprocess_c_source(code_str: str) -> Tuple[str, FrozenSet[str]]:
+    """
+    在内存中完成预处理，行号与原代码一致
+
+    :return: (可直接交给 CParser.parse 的文本, 需要预置到解析器作用域中的 typedef 名)
+    """
+    include_lines = []
+    body_lines = []
+    for line in code_str.split('\n'):
+        directive = _DIRECTIVE_LINE.match(line)
+        if directive is not None and directive.group(1) == 'include':
+            include_lines.append(line.strip())
+            body_lines.append('')
+        else:
+            body_lines.append(line)
+    body = '\n'.join(body_lines)
+
+    typedef_names, object_macros, cpp_only_macros = load_prelude(tuple(include_lines))
+    try:
+        if '\\\n' in body:
+            raise _NeedsCpp('line continuation')
+        for directive in _DIRECTIVE_LINE.finditer(body):
+            if directive.group(1) != 'pragma':
+                raise _NeedsCpp(directive.group(0))
+        body = _expand(body, object_macros, cpp_only_macros)
+    except _NeedsCpp:
+        return run_cpp(code_str), frozenset()
+    return body, typedef_names
+
+
+def parse_c_source(code_str: str, filename: str = 'c_processfile.c'):
+    """
+    从字符串解析C代码，等价于把代码写入文件后 parse_file(..., use_cpp=True)
+    头文件中的 typedef 名已预置在解析器中，返回的 FileAST 只包含代码本身的声明和函数
+
+    :return: pycparser FileAST
+    """
+    text, typedef_names = preprocess_c_source(code_str)
+    return get_parser().parse(text, filename, typedef_names=typedef_names)
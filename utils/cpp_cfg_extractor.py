@@ -1,8 +1,7 @@
-import os
 import re
 from typing import List, Dict, Optional
-from pycparser import parse_file
 import graph_gen
+from c_source_parser import parse_c_source
 from cpp_preprocessor import CppPreprocessor
 from cfg_analyzer import CfgAnalyzer
 
@@ -61,21 +60,9 @@ class CppCfgExtractor:
             c_code = self.cpp_preprocessor.cpp_to_c_conversion(body_content)
             c_wrapper = self.cpp_preprocessor.create_c_wrapper(c_code, func['name'])
             
-            # 写入临时文件
-            temp_file = f'tmp/cpp_func_{func["name"].replace("::", "_")}.c'
-            os.makedirs('tmp', exist_ok=True)
-            
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                f.write(c_wrapper)
-            
             # 尝试用pycparser解析
             try:
-                ast = parse_file(
-                    temp_file,
-                    use_cpp=True,
-                    cpp_path='/usr/bin/cpp',
-                    cpp_args='-I utils/fake_libc_include'
-                )
+                ast = parse_c_source(c_wrapper, f'cpp_func_{func["name"].replace("::", "_")}.c')
                 
                 # 使用graph_gen解析
                 graph = graph_gen.Graph(ast, func['name'])
@@ -149,18 +136,8 @@ class CppCfgExtractor:
     def _analyze_as_c_code(self, code_str: str, name: str) -> Dict:
         """作为C代码分析"""
         try:
-            # 写入临时文件
-            os.makedirs('tmp', exist_ok=True)
-            with open('tmp/c_processfile.c', 'w', encoding='utf-8') as f:
-                f.write(code_str)
-            
             # 使用pycparser解析
-            ast = parse_file(
-                'tmp/c_processfile.c',
-                use_cpp=True,
-                cpp_path='/usr/bin/cpp',
-                cpp_args='-I utils/fake_libc_include'
-            )
+            ast = parse_c_source(code_str)
             
             # 使用graph_gen解析
             graph = graph_gen.Graph(ast, name)
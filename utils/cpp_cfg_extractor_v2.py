@@ -1,12 +1,18 @@
-import os
-from typing import List, Dict
+from typing import List, Dict, Iterable
 from tree_sitter import Language, Parser
 import graph_gen
+from c_source_parser import parse_c_source
 
 # 使用 tree-sitter-cpp 包
 CPP_LANGUAGE = Language('/home/featurize/work/deepseek_coder/utils/build/my-languages.so', 'cpp')
-parser = Parser()
-parser.set_language(CPP_LANGUAGE)
+
+def create_parser() -> Parser:
+    """创建一个新的 tree-sitter C++ 解析器（Parser 不能跨进程共享，多进程时每个 worker 各建一个）"""
+    new_parser = Parser()
+    new_parser.set_language(CPP_LANGUAGE)
+    return new_parser
+
+parser = create_parser()
 
 CONTROL_FLOW_TYPES = {
     'if_statement', 'while_statement', 'for_statement', 'switch_statement',
@@ -14,84 +20,97 @@ CONTROL_FLOW_TYPES = {
     'function_definition'
 }
 
+# 分块规则的版本号，规则或解析方式变化时递增，使 split_lines 缓存中的旧结果失效
+EXTRACTOR_VERSION = 2
+
+# TreeCursor 遍历时每层的状态
+SEQ_MODE = 0
+SEQ_MODE_IN_RUN = 1
+NORMAL_MODE = 2
+
+# CFG分块节点类型
+BLOCK_NODE_TYPES = frozenset({
+    'if_statement', 'while_statement', 'for_statement', 'switch_statement',
+    'case_statement', 'return_statement', 'break_statement', 'continue_statement',
+    'compound_statement', 'do_statement', 'else_clause', 'do_while_statement'
+})
+
+# 不构成语句的节点类型：大括号、分号、注释、预处理等
+SKIP_NODE_TYPES = frozenset({
+    ';', '{', '}', 'comment', 'preproc_call', 'preproc_def', 'preproc_if',
+    'preproc_elif', 'preproc_else', 'preproc_end', 'preproc_include'
+})
+
+# 分块检测引擎：cursor 为 TreeCursor 遍历，用于实际提取（utils/main.py 只使用它）；
+# query 为 tree-sitter Query 实现的参考引擎，只用于与 cursor 互相校验结果（比 cursor 慢，见 _collect_by_query）
+ENGINES = ('cursor', 'query')
+DEFAULT_ENGINE = 'cursor'
+
+_block_query = None
+
+def _node_type_exists(node_type: str) -> bool:
+    try:
+        CPP_LANGUAGE.query(f'({node_type}) @node')
+        return True
+    except NameError:
+        return False
+
+def get_block_query():
+    """
+    编译分块规则对应的 tree-sitter Query（每个进程只编译一次）
+    捕获：函数体 @body，以及会被遍历进入的节点（函数体/复合语句、分块节点、带子节点的预处理节点）
+    与它们的每个直接子节点 @parent / @item，语法中不存在的节点类型会被忽略
+    """
+    global _block_query
+    if _block_query is None:
+        parent_types = sorted(BLOCK_NODE_TYPES | {t for t in SKIP_NODE_TYPES if t.startswith('preproc_')})
+        patterns = ['(translation_unit (function_definition (compound_statement) @body))']
+        for node_type in parent_types:
+            if _node_type_exists(node_type):
+                patterns.append(f'({node_type} _ @item) @parent')
+        _block_query = CPP_LANGUAGE.query('\n'.join(patterns))
+    return _block_query
+
 class CppCfgExtractorV2:
-    """C++ CFG提取器，基于 tree-sitter 语法树分析"""
-    def __init__(self):
-        pass
-    
+    """
+    C++ CFG提取器，基于 tree-sitter 语法树分析
+    提取器本身无状态（只持有解析器），可在大量函数间复用；批量处理请用 analyze_many
+    语法树用 TreeCursor 迭代遍历，嵌套再深也不会触发递归深度限制
+    """
+    def __init__(self, ts_parser: Parser = None, engine: str = DEFAULT_ENGINE):
+        # 未指定时使用模块级共享的解析器
+        self.parser = ts_parser if ts_parser is not None else parser
+        if engine not in ENGINES:
+            raise ValueError(f"unknown engine: {engine}, expected one of {ENGINES}")
+        self.engine = engine
+        self._collect = self._collect_by_query if engine == 'query' else self._collect_by_cursor
+
     def analyze_cpp_code(self, code_str: str, name: str = "code") -> Dict:
         """处理 C++ 代码"""
-        try:
-            # CFG分块节点类型
-            BLOCK_NODE_TYPES = {
-                'if_statement', 'while_statement', 'for_statement', 'switch_statement',
-                'case_statement', 'return_statement', 'break_statement', 'continue_statement',
-                'compound_statement', 'do_statement', 'else_clause', 'do_while_statement'
-            }
+        return self._analyze(code_str, name)
 
-            def is_block_node(node):
-                return node.type in BLOCK_NODE_TYPES
+    def analyze_c_code(self, code_str: str, name: str = "code") -> Dict:
+        """处理 C 代码"""
+        return self._analyze(code_str, name)
 
-            def is_meaningful_statement(node):
-                # 跳过大括号、空节点、注释、预处理、分号等
-                if node.type in (';', '{', '}', 'comment', 'preproc_call', 'preproc_def', 'preproc_if', 'preproc_elif', 'preproc_else', 'preproc_end', 'preproc_include'):
-                    return False
-                # 跳过空白节点
-                if not hasattr(node, 'start_point'):
-                    return False
-                return True
+    def analyze_many(self, records: Iterable[Dict]) -> List[Dict]:
+        """
+        批量处理记录，复用同一个解析器
 
-            def process_compound_statement(node, blocks):
-                if node.type != 'compound_statement':
-                    return
-                children = node.children
-                n = len(children)
-                i = 0
-                while i < n:
-                    child = children[i]
-                    if child.type == '{' or child.type == '}':
-                        i += 1
-                        continue
-                    if is_block_node(child):
-                        blocks.append(child.start_point[0] + 1)
-                        for c in child.children:
-                            if c.type == 'compound_statement':
-                                process_compound_statement(c, blocks)
-                            else:
-                                process_node_recursively(c, blocks)
-                        i += 1
-                    else:
-                        # 连续顺序语句合并为一个块，只保留首行号
-                        seq_start = i
-                        while i < n and not is_block_node(children[i]) and is_meaningful_statement(children[i]) and children[i].type not in ('{', '}'):
-                            i += 1
-                        if seq_start < i:
-                            blocks.append(children[seq_start].start_point[0] + 1)
-                        if i == seq_start:
-                            i += 1
-
-            def process_node_recursively(node, blocks):
-                if node.type == 'compound_statement':
-                    process_compound_statement(node, blocks)
-                elif is_block_node(node):
-                    blocks.append(node.start_point[0] + 1)
-                    for child in node.children:
-                        process_node_recursively(child, blocks)
-                elif is_meaningful_statement(node):
-                    blocks.append(node.start_point[0] + 1)
-                else:
-                    for child in node.children:
-                        process_node_recursively(child, blocks)
+        :param records: 含 code、name 字段的字典（如 jsonl 中的记录）
+        :return: 与输入顺序一致的结果列表
+        """
+        analyze = self._analyze
+        results = []
+        for idx, record in enumerate(records):
+            results.append(analyze(record.get('code', ''), record.get('name', f'code_{idx}')))
+        return results
 
+    def _analyze(self, code_str: str, name: str) -> Dict:
+        try:
             # 入口：只处理函数体
-            tree = parser.parse(bytes(code_str, 'utf8'))
-            root = tree.root_node
-            result = []
-            for node in root.children:
-                if node.type == 'function_definition':
-                    for child in node.children:
-                        if child.type == 'compound_statement':
-                            process_compound_statement(child, result)
+            tree = self.parser.parse(bytes(code_str, 'utf8'))
+            result = self._collect(tree)
             unique_lines = sorted(set(result))
             return {
                 "name": name,
@@ -104,104 +123,140 @@ class CppCfgExtractorV2:
                 "error": f"tree-sitter analysis failed: {str(e)}"
             }
 
-    def analyze_c_code(self, code_str: str, name: str = "code") -> Dict:
-        """处理 C 代码"""
-        try:
-            # CFG分块节点类型
-            BLOCK_NODE_TYPES = {
-                'if_statement', 'while_statement', 'for_statement', 'switch_statement',
-                'case_statement', 'return_statement', 'break_statement', 'continue_statement',
-                'compound_statement', 'do_statement', 'else_clause', 'do_while_statement'
-            }
-
-            def is_block_node(node):
-                return node.type in BLOCK_NODE_TYPES
+    def _collect_by_cursor(self, tree) -> List[int]:
+        result = []
+        cursor = tree.walk()
+        if cursor.goto_first_child():
+            while True:
+                if cursor.node.type == 'function_definition' and cursor.goto_first_child():
+                    while True:
+                        if cursor.node.type == 'compound_statement':
+                            self._walk_function_body(cursor, result)
+                        if not cursor.goto_next_sibling():
+                            break
+                    cursor.goto_parent()
+                if not cursor.goto_next_sibling():
+                    break
+        return result
 
-            def is_meaningful_statement(node):
-                # 跳过大括号、空节点、注释、预处理、分号等
-                if node.type in (';', '{', '}', 'comment', 'preproc_call', 'preproc_def', 'preproc_if', 'preproc_elif', 'preproc_else', 'preproc_end', 'preproc_include'):
-                    return False
-                # 跳过空白节点
-                if not hasattr(node, 'start_point'):
-                    return False
-                return True
+    @staticmethod
+    def _collect_by_query(tree) -> List[int]:
+        """
+        Query 参考引擎：按与 cursor 引擎相同的规则处理匹配到的 (父节点, 子节点) 对，只有从函数体可达的节点才会被处理
+        只用于校验 cursor 引擎的结果：捕获的节点要在 Python 中按父节点重新组合，而且仅 captures/matches 本身
+        （每个捕获都要创建 Node 对象）就比 cursor 引擎遍历整个函数体慢，不作为提取引擎提供
+        Query 的通配符不会匹配 ERROR 节点，含语法错误（ERROR / MISSING）的父节点改为直接取全部子节点，
+        与 cursor 引擎遍历到的节点一致
+        """
+        bodies = []
+        children = {}
+        for _, captures in get_block_query().matches(tree.root_node):
+            body = captures.get('body')
+            if body is not None:
+                bodies.append(body)
+            else:
+                children.setdefault(captures['parent'].id, []).append(captures['item'])
 
-            def process_compound_statement(node, blocks):
-                if node.type != 'compound_statement':
-                    return
-                children = node.children
-                n = len(children)
-                i = 0
-                while i < n:
-                    child = children[i]
-                    if child.type == '{' or child.type == '}':
-                        i += 1
-                        continue
-                    if is_block_node(child):
-                        blocks.append(child.start_point[0] + 1)
-                        for c in child.children:
-                            if c.type == 'compound_statement':
-                                process_compound_statement(c, blocks)
-                            else:
-                                process_node_recursively(c, blocks)
-                        i += 1
-                    else:
+        blocks = []
+        append = blocks.append
+        pending = [(body, SEQ_MODE) for body in bodies]
+        while pending:
+            node, mode = pending.pop()
+            if node.has_error:
+                items = node.children
+            else:
+                items = children.get(node.id)
+                if not items:
+                    continue
+                items.sort(key=lambda item: (item.start_byte, item.end_byte))
+            state = mode
+            for item in items:
+                item_type = item.type
+                if state != NORMAL_MODE:
+                    if item_type in BLOCK_NODE_TYPES:
+                        append(item.start_point[0] + 1)
+                        pending.append((item, NORMAL_MODE))
+                        state = SEQ_MODE
+                    elif item_type in SKIP_NODE_TYPES:
+                        state = SEQ_MODE
+                    elif state == SEQ_MODE:
                         # 连续顺序语句合并为一个块，只保留首行号
-                        seq_start = i
-                        while i < n and not is_block_node(children[i]) and is_meaningful_statement(children[i]) and children[i].type not in ('{', '}'):
-                            i += 1
-                        if seq_start < i:
-                            blocks.append(children[seq_start].start_point[0] + 1)
-                        if i == seq_start:
-                            i += 1
-
-            def process_node_recursively(node, blocks):
-                if node.type == 'compound_statement':
-                    process_compound_statement(node, blocks)
-                elif is_block_node(node):
-                    blocks.append(node.start_point[0] + 1)
-                    for child in node.children:
-                        process_node_recursively(child, blocks)
-                elif is_meaningful_statement(node):
-                    blocks.append(node.start_point[0] + 1)
+                        append(item.start_point[0] + 1)
+                        state = SEQ_MODE_IN_RUN
+                elif item_type == 'compound_statement':
+                    pending.append((item, SEQ_MODE))
+                elif item_type in BLOCK_NODE_TYPES:
+                    append(item.start_point[0] + 1)
+                    pending.append((item, NORMAL_MODE))
+                elif item_type not in SKIP_NODE_TYPES:
+                    append(item.start_point[0] + 1)
                 else:
-                    for child in node.children:
-                        process_node_recursively(child, blocks)
+                    pending.append((item, NORMAL_MODE))
+        return blocks
 
-            # 入口：只处理函数体
-            tree = parser.parse(bytes(code_str, 'utf8'))
-            root = tree.root_node
-            result = []
-            for node in root.children:
-                if node.type == 'function_definition':
-                    for child in node.children:
-                        if child.type == 'compound_statement':
-                            process_compound_statement(child, result)
-            unique_lines = sorted(set(result))
-            return {
-                "name": name,
-                "split_lines": unique_lines
-            }
-        except Exception as e:
-            return {
-                "name": name,
-                "split_lines": [],
-                "error": f"tree-sitter analysis failed: {str(e)}"
-            }
+    @staticmethod
+    def _walk_function_body(cursor, blocks: List[int]):
+        """
+        用 TreeCursor 迭代遍历函数体（cursor 位于 compound_statement 上），收集分块行号
+        不构造 children 列表、不递归，遍历结束后 cursor 回到函数体节点
+
+        每一层有两种模式：
+        - 顺序模式（compound_statement 内）：分块节点记行号并以普通模式进入；
+          连续的顺序语句合并为一个块，只记首行号，且不进入语句内部；
+          大括号、注释、预处理等会打断连续语句
+        - 普通模式（分块节点内）：compound_statement 以顺序模式进入；
+          分块节点记行号并进入；其他语句记行号不进入；大括号、注释等直接进入
+        """
+        # 每层的状态：SEQ_MODE 顺序模式 / SEQ_MODE_IN_RUN 顺序模式且处于一段连续语句中 / NORMAL_MODE 普通模式
+        goto_first_child = cursor.goto_first_child
+        goto_next_sibling = cursor.goto_next_sibling
+        goto_parent = cursor.goto_parent
+        append = blocks.append
+        states = []
+        state = SEQ_MODE
+        if not goto_first_child():
+            return
+        while True:
+            node = cursor.node
+            node_type = node.type
+            descend = None
+            if state != NORMAL_MODE:
+                if node_type in BLOCK_NODE_TYPES:
+                    append(node.start_point[0] + 1)
+                    state = SEQ_MODE
+                    descend = NORMAL_MODE
+                elif node_type in SKIP_NODE_TYPES:
+                    state = SEQ_MODE
+                elif state == SEQ_MODE:
+                    # 连续顺序语句合并为一个块，只保留首行号
+                    append(node.start_point[0] + 1)
+                    state = SEQ_MODE_IN_RUN
+            elif node_type == 'compound_statement':
+                descend = SEQ_MODE
+            elif node_type in BLOCK_NODE_TYPES:
+                append(node.start_point[0] + 1)
+                descend = NORMAL_MODE
+            elif node_type not in SKIP_NODE_TYPES:
+                append(node.start_point[0] + 1)
+            else:
+                descend = NORMAL_MODE
+
+            if descend is not None and goto_first_child():
+                states.append(state)
+                state = descend
+                continue
+            # 没有下一个兄弟节点时逐层返回
+            while not goto_next_sibling():
+                if not states:
+                    goto_parent()
+                    return
+                goto_parent()
+                state = states.pop()
     
     def _analyze_as_c_code(self, code_str: str, name: str) -> Dict:
         # 兼容接口，直接用 graph_gen 处理
         try:
-            os.makedirs('tmp', exist_ok=True)
-            with open('tmp/c_processfile.c', 'w', encoding='utf-8') as f:
-                f.write(code_str)
-            from pycparser import parse_file
-            ast = parse_file(
-                'tmp/c_processfile.c',
-                use_cpp=True,
-                cpp_path='/usr/bin/cpp',
-                cpp_args='-I utils/fake_libc_include'
-            )
+            ast = parse_c_source(code_str)
             graph = graph_gen.Graph(ast, name)
             line_numbers = self._extract_line_numbers_from_graph(graph)
             return {
@@ -1,7 +1,7 @@
-from pycparser import parse_file
 from graphviz import Digraph
 from graphviz import escape
 import os
+from c_source_parser import parse_c_source
 
 class AstNode:
     def __init__(self, gid, code=None, connectTo=None, child=None, d=None, u=None, isStart=False, isEnd=False, linenos=None):
@@ -849,9 +849,7 @@ def build_graph(path, name="test"):
                 txt += each[:each.find('//')] + '\n'
             else:
                 txt += each
-    with open('tmp/c_processfile.c', 'w', encoding='utf-8') as f:
-        f.write(txt)
-    ast = parse_file('tmp/c_processfile.c', use_cpp=True, cpp_path=r'/usr/bin/gcc', cpp_args=['-E', r'-I utils/fake_libc_include'])
+    ast = parse_c_source(txt)
     # ast.show()
     # print(ast)
     graph = Graph(ast, name)
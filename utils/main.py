@@ -1,12 +1,21 @@
 import os
 import traceback
 import graph_gen
-from pycparser import parse_file
 import json
-from cpp_cfg_extractor_v2 import CppCfgExtractorV2
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from cpp_cfg_extractor_v2 import CppCfgExtractorV2, create_parser, DEFAULT_ENGINE
+from c_source_parser import parse_c_source
+from split_lines_cache import SplitLinesCache, DEFAULT_MAX_ENTRIES
 
 CPP_EXTS = {'.cpp', '.cc', '.cxx', '.hpp', '.hxx', '.c++', '.h++'}
 
+# 并行提取时每个任务包含的记录数
+CHUNK_SIZE = 256
+
+# 所有记录共用一个提取器（无状态），避免每条记录重复构造
+_cpp_extractor = CppCfgExtractorV2()
+
 def analyze_c_code_str(code_str, name="code"):
     # 预处理C代码字符串
     txt_list = code_str.splitlines()
@@ -29,15 +38,8 @@ def analyze_c_code_str(code_str, name="code"):
             return cpp_extractor.analyze_cpp_code(txt, name)
         except Exception as e:
             return {"name": name, "split_lines": [], "error": f"C++ parsing failed: {str(e)}"}
-    with open('tmp/c_processfile.c', 'w', encoding='utf-8') as f:
-        f.write(txt)
     try:
-        ast = parse_file(
-            'tmp/c_processfile.c',
-            use_cpp=True,
-            cpp_path=r'/usr/bin/cpp',
-            cpp_args='-I utils/fake_libc_include'
-        )
+        ast = parse_c_source(txt)
         graph = graph_gen.Graph(ast, name)
         all_nodes = []
         def collect_all(node):
@@ -64,7 +66,7 @@ def analyze_c_code_str(code_str, name="code"):
         return {"name": name, "split_lines": [], "error": str(e)}
 
 def analyze_c_file(c_path, output_path):
-    # 预处理C文件，生成临时文件
+    # 预处理C文件
     with open(c_path, encoding='utf-8') as f:
         txt_list = f.readlines()
         txt = ''
@@ -75,10 +77,8 @@ def analyze_c_file(c_path, output_path):
                 txt += each[:each.find('//')] + '\n'
             else:
                 txt += each
-    with open('tmp/c_processfile.c', 'w', encoding='utf-8') as f:
-        f.write(txt)
     # 解析并生成CFG
-    ast = parse_file('tmp/c_processfile.c', use_cpp=True, cpp_path=r'/usr/bin/cpp', cpp_args='-I utils/fake_libc_include')
+    ast = parse_c_source(txt)
     graph = graph_gen.Graph(ast, os.path.splitext(os.path.basename(c_path))[0])
     # 输出所有节点信息到txt
     with open(output_path, 'w', encoding='utf-8') as f:
@@ -117,9 +117,10 @@ def analyze_c_file(c_path, output_path):
         }
         f.write(json.dumps(output_data, indent=4))
 
-def analyze_code_by_filetype(code_str, name, file_path):
+def analyze_code_by_filetype(code_str, name, file_path, cpp_extractor=None):
     ext = os.path.splitext(file_path)[1].lower()
-    cpp_extractor = CppCfgExtractorV2()
+    if cpp_extractor is None:
+        cpp_extractor = _cpp_extractor
     
     if ext in CPP_EXTS:
         # C++ 代码，走tree-sitter方案
@@ -164,7 +165,15 @@ def main_single(c_path):
         traceback.print_exc()
         pass
 
-def main_jsonl(jsonl_path, output_path):
+def open_cache(cache_path, max_entries=DEFAULT_MAX_ENTRIES):
+    """打开 split_lines 缓存，未指定路径时返回 None"""
+    if not cache_path:
+        return None
+    return SplitLinesCache(cache_path, max_entries)
+
+def main_jsonl(jsonl_path, output_path, cache_path=None, cache_max_entries=DEFAULT_MAX_ENTRIES):
+    cpp_extractor = CppCfgExtractorV2()
+    cache = open_cache(cache_path, cache_max_entries)
     results = []
     with open(jsonl_path, 'r', encoding='utf-8') as fin:
         for idx, line in enumerate(fin):
@@ -177,18 +186,161 @@ def main_jsonl(jsonl_path, output_path):
                 code = item.get('code', '')
                 name = item.get('name', f'code_{idx}')
                 file_path = item.get('file', '')
-                block_info = analyze_code_by_filetype(code, name, file_path)
+                block_info = cache.get(code, name, DEFAULT_ENGINE) if cache is not None else None
+                if block_info is None:
+                    block_info = analyze_code_by_filetype(code, name, file_path, cpp_extractor)
+                    if cache is not None:
+                        cache.put(code, DEFAULT_ENGINE, block_info)
                 results.append(block_info)
             except json.JSONDecodeError as e:
                 print(f"JSON解析错误，第{idx+1}行: {e}")
                 continue
     with open(output_path, 'w', encoding='utf-8') as fout:
         json.dump(results, fout, ensure_ascii=False, indent=2)
+    if cache is not None:
+        cache.close()
+        print(cache.stats())
+
+def iter_input_records(input_path):
+    """
+    流式读取待分析的记录，支持 .jsonl 与 .arrow（IPC stream）两种输入
+
+    Yields:
+        tuple: (记录序号, code, name, file_path)
+    """
+    if input_path.endswith('.arrow'):
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+
+        idx = 0
+        with pa.memory_map(input_path, 'r') as source, \
+             ipc.RecordBatchStreamReader(source) as reader:
+            for batch in reader:
+                columns = {}
+                for column in ('code', 'name', 'file'):
+                    index = batch.schema.get_field_index(column)
+                    columns[column] = batch.column(index).to_pylist() if index != -1 else [None] * batch.num_rows
+                for code, name, file_path in zip(columns['code'], columns['name'], columns['file']):
+                    yield idx, code or '', name if name is not None else f'code_{idx}', file_path or ''
+                    idx += 1
+        return
+
+    with open(input_path, 'r', encoding='utf-8') as fin:
+        for idx, line in enumerate(fin):
+            # 清理换行符
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"JSON解析错误，第{idx+1}行: {e}")
+                continue
+            yield idx, item.get('code', ''), item.get('name', f'code_{idx}'), item.get('file', '')
+
+def iter_chunks(records, chunk_size):
+    """将记录流按 chunk_size 分组"""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# 每个worker进程独立的提取器（含独立的 tree-sitter 解析器）
+_worker_extractor = None
+
+def _init_worker():
+    global _worker_extractor
+    _worker_extractor = CppCfgExtractorV2(create_parser())
+
+def _analyze_chunk(chunk):
+    results = []
+    for idx, code, name, file_path in chunk:
+        try:
+            results.append(analyze_code_by_filetype(code, name, file_path, _worker_extractor))
+        except Exception as e:
+            results.append({"name": name, "split_lines": [], "error": str(e)})
+    return results
+
+def main_parallel(input_path, output_path, workers=None, chunk_size=CHUNK_SIZE,
+                  cache_path=None, cache_max_entries=DEFAULT_MAX_ENTRIES):
+    """
+    多进程流式提取 split_lines
+    输入按记录序号分块分发给进程池，结果按序号顺序逐块追加写入 JSONL（每行一条），
+    同时在途的块数有上限，内存占用与输入规模无关
+    启用缓存时由主进程查询与写入缓存，只把未命中的记录交给进程池
+
+    Args:
+        input_path: 输入 .jsonl 或 .arrow 文件
+        output_path: 输出 .jsonl 文件
+        workers: 进程数，默认为CPU核数
+        chunk_size: 每个任务包含的记录数
+        cache_path: split_lines 缓存（SQLite）路径，为空时不使用缓存
+        cache_max_entries: 缓存最多保留的条目数
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 4
+    count = 0
+    cache = open_cache(cache_path, cache_max_entries)
+    with open(output_path, 'w', encoding='utf-8') as fout, \
+         ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        # 每项为 (块, 各记录的缓存结果（未命中为None）, 未命中记录的future)
+        pending = deque()
+
+        def write_next():
+            nonlocal count
+            chunk, block_infos, future = pending.popleft()
+            if future is not None:
+                computed = iter(future.result())
+                for i, (idx, code, name, file_path) in enumerate(chunk):
+                    if block_infos[i] is None:
+                        block_infos[i] = next(computed)
+                        if cache is not None:
+                            cache.put(code, DEFAULT_ENGINE, block_infos[i])
+            for block_info in block_infos:
+                fout.write(json.dumps(block_info, ensure_ascii=False) + '\n')
+                count += 1
+
+        for chunk in iter_chunks(iter_input_records(input_path), chunk_size):
+            if cache is None:
+                block_infos = [None] * len(chunk)
+            else:
+                block_infos = [cache.get(code, name, DEFAULT_ENGINE) for idx, code, name, file_path in chunk]
+            misses = [record for record, block_info in zip(chunk, block_infos) if block_info is None]
+            future = executor.submit(_analyze_chunk, misses) if misses else None
+            pending.append((chunk, block_infos, future))
+            if len(pending) >= max_pending:
+                write_next()
+        while pending:
+            write_next()
+    print(f"已写出 {count} 条结果到 {output_path}")
+    if cache is not None:
+        cache.close()
+        print(cache.stats())
 
 if __name__ == '__main__':
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='提取代码的CFG分块行号（split_lines）')
+    arg_parser.add_argument('input', nargs='?', default='view.jsonl', help='输入 .jsonl 或 .arrow 文件')
+    arg_parser.add_argument('output', nargs='?', default='all_blocks.json')
+    arg_parser.add_argument('--workers', type=int, default=None,
+                            help='指定后使用多进程流式模式，输出为JSONL（每行一条结果）')
+    arg_parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    arg_parser.add_argument('--cache', default=None,
+                            help='split_lines 缓存（SQLite）路径，已分析过的函数直接复用结果')
+    arg_parser.add_argument('--cache-max-entries', type=int, default=DEFAULT_MAX_ENTRIES)
+    args = arg_parser.parse_args()
+
     # main_single("./test_hex_float.c")
-    
+
     # main()
 
-    main_jsonl('view.jsonl', 'all_blocks.json')
-    # main_jsonl('view.jsonl', 'all_blocks.json')
\ No newline at end of file
+    if args.workers:
+        main_parallel(args.input, args.output, workers=args.workers, chunk_size=args.chunk_size,
+                      cache_path=args.cache, cache_max_entries=args.cache_max_entries)
+    else:
+        main_jsonl(args.input, args.output, cache_path=args.cache, cache_max_entries=args.cache_max_entries)
@@ -0,0 +1,111 @@
+"""
+split_lines 结果的持久化缓存（SQLite）
+
+同一个函数体会在不同分片、不同优化级别的数据中重复出现，缓存以
+“原始代码 + 提取器版本 + 引擎”的哈希为键，命中时不再解析。
+只缓存成功的结果：带 error 的结果可能是偶发失败或之后会修复的问题，每次都重新解析。
+只应由一个进程读写（多进程模式下由主进程统一查询和写入）。
+"""
+import json
+import hashlib
+import sqlite3
+from typing import Dict, Optional
+from cpp_cfg_extractor_v2 import EXTRACTOR_VERSION
+
+# 默认最多保留的条目数，超出后按最近使用时间淘汰
+DEFAULT_MAX_ENTRIES = 5_000_000
+
+# 累计多少次写入提交一次事务
+COMMIT_EVERY = 1000
+
+
+def cache_key(code_str: str, engine: str) -> str:
+    # 代码不做任何规范化：单独的 \r 不被 tree-sitter 当作换行，去掉行尾空白会让 "\ " 变成续行，都会改变 split_lines
+    raw = f'{EXTRACTOR_VERSION}\0{engine}\0{code_str}'
+    return hashlib.sha256(raw.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class SplitLinesCache:
+    """
+    以内容哈希为键的 split_lines 缓存
+
+    :param path: SQLite 数据库文件路径
+    :param max_entries: 最多保留的条目数
+    """
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._clock = 0
+        self._touched = []
+        self._pending_writes = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS split_lines ('
+            ' key TEXT PRIMARY KEY,'
+            ' result TEXT NOT NULL,'
+            ' last_used INTEGER NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS split_lines_last_used ON split_lines(last_used)')
+        row = self.conn.execute('SELECT MAX(last_used) FROM split_lines').fetchone()
+        self._clock = row[0] or 0
+
+    def get(self, code_str: str, name: str, engine: str) -> Optional[Dict]:
+        """查询缓存，命中时返回带 name 的结果，否则返回 None（旧版本写入的 error 结果视为未命中并删除）"""
+        key = cache_key(code_str, engine)
+        row = self.conn.execute('SELECT result FROM split_lines WHERE key = ?', (key,)).fetchone()
+        value = json.loads(row[0]) if row is not None else None
+        if value is None or 'error' in value:
+            if value is not None:
+                self.conn.execute('DELETE FROM split_lines WHERE key = ?', (key,))
+                self._pending_writes += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._clock += 1
+        self._touched.append((self._clock, key))
+        result = {"name": name}
+        result.update(value)
+        return result
+
+    def put(self, code_str: str, engine: str, block_info: Dict):
+        """写入一条结果（name 不参与缓存）；带 error 的结果不缓存"""
+        if 'error' in block_info:
+            return
+        value = {k: v for k, v in block_info.items() if k != 'name'}
+        self._clock += 1
+        self.conn.execute(
+            'INSERT OR REPLACE INTO split_lines (key, result, last_used) VALUES (?, ?, ?)',
+            (cache_key(code_str, engine), json.dumps(value, ensure_ascii=False), self._clock)
+        )
+        self._pending_writes += 1
+        if self._pending_writes >= COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        """提交写入、更新命中条目的使用时间，并按上限淘汰最久未使用的条目"""
+        if self._touched:
+            self.conn.executemany('UPDATE split_lines SET last_used = ? WHERE key = ?', self._touched)
+            self._touched = []
+        count = self.conn.execute('SELECT COUNT(*) FROM split_lines').fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                'DELETE FROM split_lines WHERE key IN '
+                '(SELECT key FROM split_lines ORDER BY last_used LIMIT ?)',
+                (count - self.max_entries,)
+            )
+        self.conn.commit()
+        self._pending_writes = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return f"缓存命中 {self.hits}/{total} ({rate:.1f}%)，未命中 {self.misses}"
@@ -0,0 +1,150 @@
+"""
+split_lines 结果的索引存储
+
+main.py 输出的 all_blocks JSON/JSONL 需要整体 json.load 并构建 name -> split_lines 字典后才能查询，
+大分片启动慢、内存峰值高。这里把结果一次性转换为按 name 排序的 Arrow IPC 文件：
+    name: string, split_lines: list<int32>
+读取时 memory_map 整个文件，name 与 split_lines 的 offsets/values 都直接映射为 numpy 视图，
+按 name 二分查找（O(log n)），只有被查到的那一条 split_lines 才转换为 Python int 列表。
+
+用法：
+python split_lines_store.py /home/featurize/data/all_blocks_jsons
+    将目录下的 *_all_blocks.json / *_all_blocks.jsonl 转换为同名的 *_all_blocks.arrow
+"""
+import os
+import json
+import tempfile
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+# 存储文件后缀（与 all_blocks 结果文件放在同一目录）
+STORE_SUFFIX = '.arrow'
+
+STORE_SCHEMA = pa.schema([
+    ('name', pa.string()),
+    ('split_lines', pa.list_(pa.int32())),
+])
+
+
+def iter_split_lines_results(results_file):
+    """逐条读取 all_blocks 结果文件（JSON数组或JSONL），产出 (name, split_lines)"""
+    with open(results_file, 'r', encoding='utf-8') as f:
+        if results_file.endswith('.jsonl'):
+            results = (json.loads(line) for line in f if line.strip())
+        else:
+            results = json.load(f)
+        for item in results:
+            name = item.get('name', '')
+            if name:
+                yield name, item.get('split_lines', [])
+
+
+def build_split_lines_store(results_file, store_path):
+    """
+    将 all_blocks 结果文件转换为按 name 排序的存储文件（重名时后出现的覆盖先出现的，与字典行为一致）
+
+    Returns:
+        int: 写入的条目数
+    """
+    split_lines_map = dict(iter_split_lines_results(results_file))
+    # UTF-8 字节序与 Python 字符串的码点序一致，查找时可直接比较字节
+    names = sorted(split_lines_map)
+    table = pa.table({
+        'name': pa.array(names, pa.string()),
+        'split_lines': pa.array([split_lines_map[name] for name in names], pa.list_(pa.int32())),
+    }, schema=STORE_SCHEMA)
+
+    # 先写临时文件再替换，转换中断不会留下半个存储文件
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(store_path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as sink, ipc.new_file(sink, STORE_SCHEMA) as writer:
+            writer.write_table(table, max_chunksize=max(len(names), 1))
+        os.replace(tmp_path, store_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return len(names)
+
+
+class SplitLinesStore:
+    """
+    memory_map 的 split_lines 只读存储，接口与 name -> split_lines 字典兼容（get / in / len）
+
+    :param store_path: build_split_lines_store 生成的文件
+    """
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self._source = pa.memory_map(store_path, 'r')
+        table = ipc.open_file(self._source).read_all().combine_chunks()
+        names = table.column('name').chunk(0) if table.num_rows else pa.array([], pa.string())
+        split_lines = table.column('split_lines').chunk(0) if table.num_rows else pa.array([], pa.list_(pa.int32()))
+        self._length = len(names)
+        # 以下均为映射文件上的零拷贝视图
+        self._name_offsets = np.frombuffer(names.buffers()[1], dtype=np.int32,
+                                           count=len(names) + 1, offset=names.offset * 4)
+        self._name_data = memoryview(names.buffers()[2] or b'')
+        self._split_offsets = split_lines.offsets.to_numpy()
+        self._split_values = split_lines.values.to_numpy(zero_copy_only=True)
+
+    def _find(self, name):
+        """二分查找 name 的行号，不存在时返回 -1"""
+        key = name.encode('utf-8', 'surrogatepass')
+        offsets = self._name_offsets
+        data = self._name_data
+        lo, hi = 0, self._length
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if data[offsets[mid]:offsets[mid + 1]].tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._length and data[offsets[lo]:offsets[lo + 1]].tobytes() == key:
+            return lo
+        return -1
+
+    def get(self, name, default=None):
+        row = self._find(name)
+        if row == -1:
+            return default
+        return self._split_values[self._split_offsets[row]:self._split_offsets[row + 1]].tolist()
+
+    def __getitem__(self, name):
+        row = self._find(name)
+        if row == -1:
+            raise KeyError(name)
+        return self._split_values[self._split_offsets[row]:self._split_offsets[row + 1]].tolist()
+
+    def __contains__(self, name):
+        return self._find(name) != -1
+
+    def __len__(self):
+        return self._length
+
+    def close(self):
+        self._source.close()
+
+
+def convert_dir(all_blocks_dir):
+    """转换目录下所有尚未转换（或比存储文件更新）的 all_blocks 结果文件"""
+    for file in sorted(os.listdir(all_blocks_dir)):
+        base, ext = os.path.splitext(file)
+        if not base.endswith('_all_blocks') or ext not in ('.json', '.jsonl'):
+            continue
+        results_file = os.path.join(all_blocks_dir, file)
+        store_path = os.path.join(all_blocks_dir, base + STORE_SUFFIX)
+        if os.path.exists(store_path) and os.path.getmtime(store_path) >= os.path.getmtime(results_file):
+            print(f"跳过 {file}: 存储文件已是最新")
+            continue
+        count = build_split_lines_store(results_file, store_path)
+        print(f"{file} -> {store_path}: {count} 条")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='将 all_blocks 结果转换为按 name 索引的 Arrow 存储')
+    arg_parser.add_argument('all_blocks_dir')
+    args = arg_parser.parse_args()
+    convert_dir(args.all_blocks_dir)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+split_lines 缓存的测试：经过缓存得到的结果必须与直接解析的结果一致
+"""
+import itertools
+import pytest
+from cpp_cfg_extractor_v2 import CppCfgExtractorV2
+from split_lines_cache import SplitLinesCache
+
+# 同一个函数的不同写法：换行符不同，或行尾空白会影响续行
+CODE_VARIANTS = [
+    "void f(){\r  int a=1;\r  if(a){\r return;}\r}",
+    "void f(){\n  int a=1;\n  if(a){\n return;}\n}",
+    "void f(){\r\n  int a=1;\r\n  if(a){\r\n return;}\r\n}",
+    "void f(){\n  int a=1; \\ \n  if(a){\n return;}\n}",
+    "void f(){\n  int a=1; \\\n  if(a){\n return;}\n}",
+]
+
+
+def analyze_with_cache(cache, extractor, code, name='f', engine='cursor'):
+    """与 utils/main.py 相同的用法：未命中时解析并写入缓存"""
+    block_info = cache.get(code, name, engine)
+    if block_info is None:
+        block_info = extractor.analyze_cpp_code(code, name)
+        cache.put(code, engine, block_info)
+    return block_info
+
+
+@pytest.mark.parametrize('order', list(itertools.permutations(range(len(CODE_VARIANTS)), 2)))
+def test_cached_result_matches_uncached(tmp_path, order):
+    extractor = CppCfgExtractorV2()
+    cache = SplitLinesCache(str(tmp_path / 'cache.db'))
+    try:
+        # 先缓存一种写法，另一种写法的结果不能被它影响；再次查询时命中缓存且结果不变
+        for idx in order + order:
+            code = CODE_VARIANTS[idx]
+            assert analyze_with_cache(cache, extractor, code) == extractor.analyze_cpp_code(code, 'f')
+        assert cache.hits == len(order)
+    finally:
+        cache.close()
+
+
+def test_error_results_are_not_cached(tmp_path):
+    cache = SplitLinesCache(str(tmp_path / 'cache.db'))
+    try:
+        cache.put('int f() {}', 'cursor', {'name': 'f', 'split_lines': [], 'error': 'transient failure'})
+        assert cache.get('int f() {}', 'f', 'cursor') is None
+        cache.put('int f() {}', 'cursor', {'name': 'f', 'split_lines': [1]})
+        assert cache.get('int f() {}', 'g', 'cursor') == {'name': 'g', 'split_lines': [1]}
+    finally:
+        cache.close()
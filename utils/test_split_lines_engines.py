@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+split_lines 两个引擎（cursor / query）与改写前的递归实现逐条比对
+数据：view.jsonl 中的函数、手写的语法错误样例，以及对 view.jsonl 随机增删字符得到的畸形代码
+"""
+import os
+import json
+import random
+import pytest
+from cpp_cfg_extractor_v2 import CppCfgExtractorV2, parser
+
+VIEW_JSONL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'view.jsonl')
+
+# 含 ERROR / MISSING 节点的函数
+MALFORMED_CODES = [
+    "int f() {\n  int x = ;\n  if (x) {\n    y = 2\n  }\n  return x;\n}",
+    "int f() {\n  a = 1;\n  @@@;\n  b = 2;\n  while (a) { a--; }\n}",
+    "int f() {\n  if (a {\n    b();\n  }\n  c();\n}",
+    "int f() {\n  x = 1\n  y = 2;\n  return\n}",
+    "void g() {\n  for (i = 0; i < n; i++ {\n    s += i;\n  }\n  switch (s) { case 1: break; default: s = 0; }\n}",
+    "int f() {\n  a();\n  } }\n  b();\n}",
+    "int f() {\n  do { a(); } while (x)\n  return 1;\n}",
+    "int f() {\n  int a[] = {1, 2,;\n  else { b(); }\n  c();\n}",
+    "int f() {\n  if (x) a(); else b()\n  c();\n}",
+    "int f() {\n  label: x++;\n  goto label;\n  ??? ;\n}",
+]
+
+NUM_MUTATIONS = 300
+
+BLOCK_NODE_TYPES = {
+    'if_statement', 'while_statement', 'for_statement', 'switch_statement',
+    'case_statement', 'return_statement', 'break_statement', 'continue_statement',
+    'compound_statement', 'do_statement', 'else_clause', 'do_while_statement'
+}
+
+SKIP_TYPES = ('{', '}', ';', 'comment', 'preproc_call', 'preproc_def', 'preproc_if', 'preproc_elif',
+              'preproc_else', 'preproc_end', 'preproc_include')
+
+
+def baseline_split_lines(code_str):
+    """改写为 TreeCursor / Query 之前的递归实现（按原样保留，作为比对基准）"""
+    def is_block_node(node):
+        return node.type in BLOCK_NODE_TYPES
+
+    def is_meaningful_statement(node):
+        return node.type not in SKIP_TYPES
+
+    def process_compound_statement(node, blocks):
+        children = node.children
+        n = len(children)
+        i = 0
+        while i < n:
+            child = children[i]
+            if child.type == '{' or child.type == '}':
+                i += 1
+                continue
+            if is_block_node(child):
+                blocks.append(child.start_point[0] + 1)
+                for c in child.children:
+                    if c.type == 'compound_statement':
+                        process_compound_statement(c, blocks)
+                    else:
+                        process_node_recursively(c, blocks)
+                i += 1
+            else:
+                seq_start = i
+                while i < n and not is_block_node(children[i]) and is_meaningful_statement(children[i]):
+                    i += 1
+                if seq_start < i:
+                    blocks.append(children[seq_start].start_point[0] + 1)
+                if i == seq_start:
+                    i += 1
+
+    def process_node_recursively(node, blocks):
+        if node.type == 'compound_statement':
+            process_compound_statement(node, blocks)
+        elif is_block_node(node):
+            blocks.append(node.start_point[0] + 1)
+            for child in node.children:
+                process_node_recursively(child, blocks)
+        elif is_meaningful_statement(node):
+            blocks.append(node.start_point[0] + 1)
+        else:
+            for child in node.children:
+                process_node_recursively(child, blocks)
+
+    tree = parser.parse(bytes(code_str, 'utf8'))
+    result = []
+    for node in tree.root_node.children:
+        if node.type == 'function_definition':
+            for child in node.children:
+                if child.type == 'compound_statement':
+                    process_compound_statement(child, result)
+    return sorted(set(result))
+
+
+def load_view_codes():
+    with open(VIEW_JSONL, 'r', encoding='utf-8') as f:
+        return [json.loads(line)['code'] for line in f if line.strip()]
+
+
+def mutated_codes(codes, count, seed=0):
+    """对函数随机删除或插入少量字符，得到带语法错误的代码"""
+    rng = random.Random(seed)
+    results = []
+    for _ in range(count):
+        code = list(rng.choice(codes))
+        for _ in range(rng.randint(1, 4)):
+            pos = rng.randrange(len(code))
+            if rng.random() < 0.5:
+                del code[pos]
+            else:
+                code.insert(pos, rng.choice('{}();=@#\n'))
+        results.append(''.join(code))
+    return results
+
+
+def assert_engines_agree(codes):
+    cursor = CppCfgExtractorV2(engine='cursor')
+    query = CppCfgExtractorV2(engine='query')
+    for code in codes:
+        expected = baseline_split_lines(code)
+        cursor_result = cursor.analyze_cpp_code(code)
+        query_result = query.analyze_cpp_code(code)
+        assert 'error' not in cursor_result and 'error' not in query_result
+        assert cursor_result['split_lines'] == expected, code
+        assert query_result['split_lines'] == expected, code
+
+
+def test_view_jsonl():
+    codes = load_view_codes()
+    assert codes
+    assert_engines_agree(codes)
+
+
+@pytest.mark.parametrize('code', MALFORMED_CODES)
+def test_malformed(code):
+    assert parser.parse(bytes(code, 'utf8')).root_node.has_error
+    assert_engines_agree([code])
+
+
+def test_mutated_view_jsonl():
+    assert_engines_agree(mutated_codes(load_view_codes(), NUM_MUTATIONS))